@@ -16,11 +16,12 @@ from app.blueprints.auth import auth as auth_blueprint
 from app.blueprints.dashboard import dashboard as dashboard_blueprint
 from app.blueprints.main import main as main_blueprint
 from app.blueprints.task import task as task_blueprint
+from app.blueprints.util import update_missing_metadata
 from app.cache import cache
 from app.conf.config import ProductionConfig, DevConfig
-from app.db import db
+from app.db import db, add_missing_columns
 from app.mail import mail
-from app.model import User
+from app.model import User, Dataset
 from app.util import ensure_exists_folder
 
 from app.celery_app import celery_app
@@ -57,6 +58,21 @@ def setup_db(app):
         app.logger.debug("Setup db")
 
 
+def update_db(app):
+    # One-off migration of an existing db (not run on startup, i.e., not concurrently by several workers)
+    with app.app_context():
+        add_missing_columns(Dataset)    # metadata columns of datasets
+        update_missing_metadata()
+        app.logger.debug("Updated db")
+
+
+def register_commands(app):
+    @app.cli.command('update-db')
+    def update_db_command():
+        """Add missing columns to the db and record the metadata of previously uploaded datasets."""
+        update_db(app)
+
+
 def create_test_user(app):
     with app.app_context():
         user = User(email="",
@@ -122,6 +138,8 @@ def create_app(configuration=ProductionConfig()):
     register_blueprints(app)
     log.debug('Registered blueprints')
 
+    register_commands(app)
+
     # Setup database
     setup_db(app)
 
@@ -139,5 +157,6 @@ def create_app(configuration=ProductionConfig()):
 
 if __name__ == '__main__':
     app = create_app(configuration=DevConfig())
+    update_db(app)
     create_test_user(app)
     app.run(debug=True)
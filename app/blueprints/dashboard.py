@@ -4,10 +4,12 @@ import os
 
 from flask import Blueprint, render_template, url_for, request
 from flask_login import login_required, current_user
+from pyarrow import ArrowException
 from werkzeug.utils import redirect
 
 from app.blueprints.forms import UploadDatasetForm
-from app.blueprints.util import load_data, delete_data, get_clustering_info, _get_user_folder, redirect_url
+from app.blueprints.util import query_data, save_data, delete_data, get_clustering_info, get_user_quota, \
+    read_schema, _get_user_folder, redirect_url
 from app.db import db
 from app.decorators import confirmation_required
 from app.model import Dataset
@@ -42,28 +44,36 @@ def datasets():
         new_dataset = Dataset(name=name, owner=owner, description=description, label_column=label_column,
                               prediction_column=prediction_column)
 
-        # Add dataset object to database
-        db.session.add(new_dataset)
-        db.session.commit()
-        log.debug(f"Added {new_dataset} to database")
-
         # Ensure user has an upload folder already
         user_folder = _get_user_folder(owner)
         ensure_exists_folder(user_folder)
 
-        # Save data file in user_folder
-        f = form.dataset.data
-        file_path = os.path.join(user_folder, new_dataset.id + '.csv')
-        f.seek(0)  # to avoid storing an empty file
-        f.save(file_path)
-        if not os.path.exists(file_path):
-            db.session.delete(new_dataset)
-            db.session.commit()
+        # Save data file (columnar) in user_folder first, then the dataset with its metadata in the database
+        try:
+            file_path = save_data(new_dataset, form.parsed_data)
+        except ArrowException as err:
+            log.debug(f"Could not save {new_dataset}: {err}")
             return redirect(url_for('dashboard.datasets', info_modal_title='An error occurred',
-                                    info_modal_body='Could not save your dataset!'))
-
-        # Redirect to same page (to clear form inputs)
-        return redirect(url_for('dashboard.datasets'))
+                                    info_modal_body='Could not save your dataset (columns must have a single type)!'))
+
+        # The quota is counted in bytes of the stored files (see get_user_quota)
+        max_bytes = get_user_quota(owner)['quota_free']
+        if new_dataset.n_bytes > max_bytes:
+            os.remove(file_path)
+            form.dataset.errors.append(f"Free disk quota is {max_bytes} Bytes (stored dataset: "
+                                       f"{new_dataset.n_bytes} Bytes)")
+        else:
+            try:
+                db.session.add(new_dataset)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                os.remove(file_path)
+                raise
+            log.debug(f"Added {new_dataset} to database")
+
+            # Redirect to same page (to clear form inputs)
+            return redirect(url_for('dashboard.datasets'))
 
     # Get all the user's datasets
     dataset_list = Dataset.query.filter_by(owner=owner)
@@ -110,8 +120,9 @@ def inspect():
             return redirect(url_for('dashboard.datasets', info_modal_title="Selected dataset not found",
                                     info_modal_body=f"Couldn't find a dataset named {selected_name}."))
 
-    # Load data columns+types (cached)
-    columns = load_data(current_user.id, dataset.id).dtypes  # TODO try catch
+    # Data columns+types (from the metadata or the schema of the file if not recorded yet)
+    columns = {c['name']: c['dtype'] for c in dataset.columns} if dataset.columns is not None \
+        else read_schema(dataset.owner, dataset.id)[1]
     # log.debug(f"{type(columns)}: {columns}")
 
     return render_template('dashboard/inspect.html', all_datasets=all_datasets, dataset=dataset, columns=columns)
@@ -131,23 +142,15 @@ def raw_data(name):
     order = request.args.get('order')
     filter = request.args.get('filter')
 
-    # Query dataset object from database and load data
+    # Query dataset object from database
     d = Dataset.query.filter_by(owner=current_user.id, name=name).first_or_404()
-    data = load_data(current_user.id, d.id)  # TODO try catch
 
-    # Apply filter
+    # Apply filter (substrings), sort & paginate the data with its (cached) query index
     if filter:
-        log.debug(f"Filter {filter} {type(filter)}")
         filter = json.loads(filter)
         log.debug(f"Filter {filter} {type(filter)}")
-        for c, f in filter.items():
-            data = data[data[c].astype(str).str.contains(f)]
-
-    # Paginate & sort loaded data
-    total_rows = len(data)
-    if sort and order:
-        data = data.sort_values(by=sort, ascending=(order == 'asc'))
-    data = data.iloc[offset:offset + limit]
+    total_rows, data = query_data(current_user.id, d.id, filters=filter, sort=sort if sort and order else None,
+                                  ascending=(order == 'asc'), offset=offset, limit=limit)  # TODO try catch
 
     # Prepare json from dataframe
     data_json = data.to_json(orient='records')
@@ -165,21 +168,21 @@ def raw_data(name):
 def raw_data_columns():
     id = request.args.get('id')  # might be None
     d = Dataset.query.filter_by(owner=current_user.id, id=id).first_or_404()
-    columns = load_data(current_user.id, d.id).dtypes
-    columns = columns.drop([d.label_column, d.prediction_column])
-    return columns.to_json(default_handler=str)  # default handler to fix recursion OverflowError
+    columns = {c['name']: c['dtype'] for c in d.columns} if d.columns is not None else read_schema(d.owner, d.id)[1]
+    columns = {col: dtype for col, dtype in columns.items() if col not in (d.label_column, d.prediction_column)}
+    return json.dumps(columns)
 
 
 @dashboard.route('/dashboard/datasets/sizes')
 @login_required
 @confirmation_required
 def raw_data_sizes():
-    all_datasets = Dataset.query.filter_by(owner=current_user.id).order_by(Dataset.name).all()
-    if len(all_datasets) <= 0:
+    sizes = db.session.query(Dataset.id, Dataset.n_rows).filter_by(owner=current_user.id).order_by(Dataset.name).all()
+    if len(sizes) <= 0:
         return redirect(url_for('dashboard.datasets', info_modal_title="No datasets found",
                                 info_modal_body="You have to upload a dataset first."))
-    # Return sizes of all datasets
-    return {d.id: len(load_data(current_user.id, d.id)) for d in all_datasets}
+    # Return sizes of all datasets (from the metadata or the file if not recorded yet)
+    return {id: n_rows if n_rows is not None else read_schema(current_user.id, id)[0] for id, n_rows in sizes}
 
 
 @dashboard.route('/dashboard/fairness')
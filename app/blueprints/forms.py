@@ -12,7 +12,7 @@ from wtforms import HiddenField, PasswordField, BooleanField, SubmitField, FileF
 from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, Regexp, Email
 
 from app.auth import verify_password
-from app.blueprints.util import get_redirect_target, is_safe_url, get_user_quota
+from app.blueprints.util import get_redirect_target, is_safe_url
 from app.model import *
 
 log = logging.getLogger()
@@ -119,18 +119,9 @@ class RegisterForm(RedirectForm):
         _check_password(field.data)
 
 
-class FileExceedsQuota:
-    def __call__(self, form, field):
-        quota = get_user_quota(current_user.id)
-        max_bytes = quota['quota_free']
-        if len(field.data.read()) > max_bytes:
-            raise ValidationError(f"Free disk quota is {max_bytes} Bytes")
-
-
 class UploadDatasetForm(RedirectForm):
     dataset = FileField("", validators=[FileRequired('No file provided!'),
-                                        FileAllowed(['csv'], 'Upload must be a csv-file!'),
-                                        FileExceedsQuota()])
+                                        FileAllowed(['csv'], 'Upload must be a csv-file!')])
     name = StringField('Dataset name', validators=[DataRequired(), Length(min=1, max=DATASET_NAME_LENGTH)])
     description = StringField('Dataset description (optional)')
     label_column = StringField('Class label column (default: class)')
@@ -140,6 +131,7 @@ class UploadDatasetForm(RedirectForm):
     def __init__(self, owner, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.owner = owner
+        self.parsed_data = None     # data parsed on validation
 
     def validate(self, **kwargs):
         # Parent validation
@@ -194,6 +186,7 @@ class UploadDatasetForm(RedirectForm):
                 self.prediction_column.errors.append(f"Couldn't find column {prediction}")
                 success = False
 
+        self.parsed_data = df   # reused for storing the dataset
         return success
 
 
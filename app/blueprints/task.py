@@ -1,16 +1,17 @@
 import logging
 import math
 
-from flask import Blueprint, jsonify, request, url_for, abort
+from flask import Blueprint, Response, jsonify, request, url_for, abort
 from flask_login import login_required, current_user
 from pyclustering.cluster.center_initializer import kmeans_plusplus_initializer
 from pyclustering.cluster.xmeans import xmeans
 from sklearn.cluster import KMeans
 
-from app.blueprints.util import load_data, get_param_dict
+from app.blueprints.util import analysis_columns, data_version, get_param_dict
 from app.decorators import confirmation_required
 from app.model import Dataset
 from app.tasks import fairness_analysis, FairnessTask
+from subgroup_detection.fairness import FairnessResult
 
 task = Blueprint('task', __name__)
 log = logging.getLogger()
@@ -43,13 +44,14 @@ def start_fairness_task():
     param_dict = get_param_dict(algorithm, parameters, values)
     log.debug(f"{param_dict}")
 
-    # Load data & serialize
-    data = load_data(current_user.id, dataset_id)
-    data_json = data.to_json()  # json serialization is required to send task
+    # Reference the stored data (the worker loads it from the shared upload folder), restricted to the
+    # features and the label and prediction columns of the analysis
+    dataset = Dataset.query.filter_by(owner=current_user.id, id=dataset_id).first_or_404()
+    data_ref = {'id': dataset.id, 'owner': dataset.owner, 'version': data_version(dataset.owner, dataset.id),
+                'columns': analysis_columns(dataset)}
 
     # Start task
-    dataset = Dataset.query.get(dataset_id)
-    t = fairness_analysis.delay(data_json, algorithm, pos_label=pos_label, threshold=threshold,
+    t = fairness_analysis.delay(data_ref, algorithm, pos_label=pos_label, threshold=threshold,
                                 categ_columns=categ_columns, label_column=dataset.label_column,
                                 prediction_column=dataset.prediction_column, param_dict=param_dict,
                                 estimate_k=estimate_k)
@@ -84,9 +86,8 @@ def status():
         response = {
             'state': t.state,
             'status': 'Successfully finished task!',
-            'result': t.info  # task.info is a json string (result)
+            'result': url_for('task.result')  # task.info is the serialized result (bytes)
         }
-        FairnessTask.delete(current_user)  # remove cache entry
     else:
         # something went wrong in the background job (states: FAILURE, RETRY, REVOKED)
         response = {
@@ -96,3 +97,22 @@ def status():
         # FairnessTask.delete(current_user)  # remove cache entry????
 
     return jsonify(response)  # TODO return stream
+
+
+@task.route('/task/fairness/result')
+@login_required
+@confirmation_required
+def result():
+    # Is there a finished task?
+    current_task_id = FairnessTask.get(current_user)
+    if current_task_id is None:
+        return abort(404)
+    t = fairness_analysis.AsyncResult(current_task_id)
+    if t.state != 'SUCCESS':
+        return abort(404)
+    FairnessTask.delete(current_user)  # remove cache entry
+
+    # Binary result (see FairnessResult.to_bytes) or json on request (format=json)
+    if request.args.get('format') == 'json':
+        return Response(FairnessResult.from_bytes(t.info).to_json(), mimetype='application/json')
+    return Response(t.info, mimetype='application/octet-stream')
@@ -4,14 +4,18 @@ import os
 from urllib.parse import urlparse, urljoin
 
 import pandas as pd
-from flask import request, abort, url_for, current_app
+from pyarrow import ArrowException, feather
+from flask import request, abort, url_for, current_app, has_app_context
 from pyclustering.cluster.center_initializer import kmeans_plusplus_initializer
 from pyclustering.cluster.xmeans import xmeans
 from sklearn.cluster import *
+from sqlalchemy import func
 
-from app.cache import cache
+from app.cache import data_cache
 from app.db import db
 from app.model import Dataset
+from app.table_index import TableIndex
+from app.util import get_upload_folder
 from subgroup_detection.util import prepare
 
 log = logging.getLogger()
@@ -39,30 +43,148 @@ def redirect_url(endpoint='main.index'):
     return next or url_for(endpoint)
 
 
-@cache.memoize(60)  # cache for 1 min TODO change timeout?
-def load_data(owner, dataset):
-    file_path = _get_file_path(owner, dataset)
-    log.debug(f"Loading data from file {file_path}")
-    with open(file_path, 'r') as f:
-        f.seek(0)  # reset buffer to avoid EmptyDataError
-        log.debug(f)
-        return pd.read_csv(f)
+def save_data(dataset, data):
+    """
+    Store the data of an uploaded csv-file (parsed once on validation) as an (uncompressed) Arrow IPC/Feather
+    file, such that the inferred types are frozen and the file does not have to be parsed again on loading.
+    The metadata of the data is recorded in the dataset object (not committed). If the data cannot be stored
+    (e.g., object columns of mixed types), no file is left behind.
+    :param dataset: Dataset object
+    :param data: Parsed data of the uploaded file
+    :return: Path of the stored file
+    :raises pyarrow.ArrowException: If the data cannot be converted to Arrow
+    """
+    try:
+        file_path = _write_data(dataset.owner, dataset.id, data)
+    except ArrowException:
+        file_path = _get_file_path(dataset.owner, dataset.id)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    set_metadata(dataset, data, file_path)
+    return file_path
+
+
+def set_metadata(dataset, data, file_path):
+    """
+    Record the number of rows, the file size and the names, types and cardinalities of the columns
+    in the dataset object (not committed).
+    :param dataset: Dataset object
+    :param data: Data of the dataset
+    :param file_path: Path of the stored file
+    """
+    cardinality = data.nunique()
+    dataset.n_rows = len(data)
+    dataset.n_bytes = os.path.getsize(file_path)
+    dataset.columns = [{'name': col, 'dtype': str(dtype), 'cardinality': int(cardinality[col])}
+                       for col, dtype in data.dtypes.items()]
+
+
+def update_missing_metadata():
+    # Record the metadata of datasets uploaded before the metadata catalogue (reads their files once)
+    for d in Dataset.query.filter(Dataset.n_rows.is_(None)).all():
+        file_path = _ensure_columnar(d.owner, d.id)
+        if os.path.exists(file_path):
+            set_metadata(d, read_data(d.owner, d.id), file_path)
+            log.debug(f"Updated metadata of {d}")
+    db.session.commit()
 
 
-@cache.memoize(60)
-def data_size(owner, dataset):
-    file_path = _get_file_path(owner, dataset)
-    return os.path.getsize(file_path)
+def load_data(owner, dataset, columns=None):
+    """
+    Load a dataset from its columnar file. The loaded data is cached in the worker process
+    until the file changes (size or modification time) or the dataset is deleted.
+    The cached data is shared, i.e., it must not be modified.
+    :param owner: Id of the user
+    :param dataset: Id of the dataset
+    :param columns: Names of the columns to read or None (all columns)
+    :return: Dataset
+    """
+    key = (owner, dataset, None if columns is None else tuple(columns))
+    return data_cache.get(key, data_version(owner, dataset), lambda: read_data(owner, dataset, columns=columns))
+
+
+def query_data(owner, dataset, filters=None, sort=None, ascending=True, offset=0, limit=10):
+    """
+    Filter, sort and paginate a dataset with its query index (see TableIndex.query). The index is cached
+    (and evicted) with the data. If the dataset is too large to be cached, a temporary index without
+    trigrams is used.
+    :param owner: Id of the user
+    :param dataset: Id of the dataset
+    :return: Number of rows matching the filters and the rows of the page
+    :rtype: (int, pd.DataFrame)
+    """
+    key = (owner, dataset, None)    # key of load_data
+    version = data_version(owner, dataset)
+    data = load_data(owner, dataset)
+    index = data_cache.derived(key, version, 'table_index', TableIndex)
+    if index is None or index.data is not data:
+        index = TableIndex(data, max_ngram_values=0)
+    total, rows = index.query(filters=filters, sort=sort, ascending=ascending, offset=offset, limit=limit)
+    data_cache.update(key)  # the index may have grown
+    return total, data.iloc[rows]
+
+
+def data_version(owner, dataset):
+    """
+    Version of the stored file of a dataset.
+    :param owner: Id of the user
+    :param dataset: Id of the dataset
+    :return: Size and modification time (ns) of the file
+    :rtype: (int, int)
+    """
+    stat = os.stat(_ensure_columnar(owner, dataset))
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_data(owner, dataset, columns=None):
+    """
+    Read a dataset from its columnar file (not cached, also usable outside an application context).
+    The file is memory-mapped, i.e., only the pages of the selected columns are read from disk.
+    :param owner: Id of the user
+    :param dataset: Id of the dataset
+    :param columns: Names of the columns to read or None (all columns)
+    :return: Dataset
+    """
+    file_path = _ensure_columnar(owner, dataset)
+    log.debug(f"Loading data from file {file_path}")
+    return feather.read_feather(file_path, columns=columns, memory_map=True)
+
+
+def analysis_columns(dataset):
+    """
+    Columns of a dataset used by the fairness analysis, i.e., the features (all other columns) followed by
+    the label and prediction column.
+    :param dataset: Dataset object
+    :return: Names of the columns
+    :rtype: list of str
+    """
+    names = [c['name'] for c in dataset.columns] if dataset.columns is not None \
+        else list(read_schema(dataset.owner, dataset.id)[1])
+    targets = [dataset.label_column, dataset.prediction_column]
+    return [col for col in names if col not in targets] + targets
+
+
+def read_schema(owner, dataset):
+    """
+    Read the number of rows and the types of the columns of a dataset without loading its data
+    (for datasets whose metadata is not recorded yet, see update_missing_metadata).
+    :param owner: Id of the user
+    :param dataset: Id of the dataset
+    :return: Number of rows and types of the columns
+    :rtype: (int, dict)
+    """
+    table = feather.read_table(_ensure_columnar(owner, dataset), memory_map=True)    # zero-copy, not read
+    dtypes = table.schema.empty_table().to_pandas().dtypes
+    return table.num_rows, {col: str(dtype) for col, dtype in dtypes.items()}
 
 
 def get_user_quota(owner, MAX_QUOTA_MB=MAX_QUOTA_MB):
-    all_datasets = Dataset.query.filter_by(owner=owner).all()
-    quota_used = {}
-    bytes_used = 0
-    for d in all_datasets:
-        size = data_size(owner, d.id)
-        quota_used[d.name] = size
-        bytes_used += size
+    # Sizes of the stored (columnar) files of the datasets and their sum from the metadata
+    size = func.coalesce(Dataset.n_bytes, 0)
+    quota_used = dict(db.session.query(Dataset.name, size).filter_by(owner=owner).all())
+    # sum of a bigint is numeric (Decimal) in PostgreSQL
+    bytes_used = int(db.session.query(func.coalesce(func.sum(size), 0)).filter_by(owner=owner).scalar())
     bytes_free = MAX_QUOTA_MB * 1024 * 1024 - bytes_used
     return {'quota_used': quota_used, 'quota_free': bytes_free}
 
@@ -73,12 +195,13 @@ def delete_data(owner, dataset):
     db.session.delete(dataset)
     db.session.commit()
 
-    # Delete cache entry (if exists)
-    cache.delete_memoized(load_data, owner, dataset.id)
+    # Delete cache entries (if exist)
+    data_cache.invalidate(lambda key: key[:2] == (owner, dataset.id))
 
     # Remove data files from disk
-    file_path = _get_file_path(owner, dataset.id)
-    os.remove(file_path)
+    for file_path in (_get_file_path(owner, dataset.id), _get_csv_path(owner, dataset.id)):
+        if os.path.exists(file_path):
+            os.remove(file_path)
     log.debug(f"Deleted dataset!")
 
 
@@ -106,14 +229,38 @@ def delete_user_account(user):
 
 
 def _get_user_folder(owner):
-    return os.path.join(current_app.config['UPLOAD_FOLDER'], owner)
+    upload_folder = current_app.config['UPLOAD_FOLDER'] if has_app_context() else get_upload_folder()
+    return os.path.join(upload_folder, owner)
 
 
 def _get_file_path(owner, dataset):
+    user_folder = _get_user_folder(owner)
+    return os.path.join(user_folder, dataset + '.feather')
+
+
+def _get_csv_path(owner, dataset):
     user_folder = _get_user_folder(owner)
     return os.path.join(user_folder, dataset + '.csv')
 
 
+def _ensure_columnar(owner, dataset):
+    # Convert datasets uploaded as plain csv-files (before the columnar storage) on first access
+    file_path = _get_file_path(owner, dataset)
+    csv_path = _get_csv_path(owner, dataset)
+    if not os.path.exists(file_path) and os.path.exists(csv_path):
+        log.debug(f"Converting {csv_path} to columnar file")
+        _write_data(owner, dataset, pd.read_csv(csv_path))
+        os.remove(csv_path)
+    return file_path
+
+
+def _write_data(owner, dataset, data):
+    file_path = _get_file_path(owner, dataset)
+    feather.write_feather(data, file_path, compression='uncompressed')
+    log.debug(f"Saved data to file {file_path}")
+    return file_path
+
+
 # @cache.memoize(timeout=600)
 def get_clustering_info():
     return _model_params()
@@ -1,3 +1,7 @@
+import os
+import threading
+from collections import OrderedDict
+
 from flask_caching import Cache
 
 from app.conf.config import ProductionConfig
@@ -9,3 +13,118 @@ cache = Cache(config={
     'CACHE_KEY_PREFIX': 'cache'         # prevent flushing of whole db on cache clear (e.g. celery queue)
 })
 
+
+class _Entry:
+    def __init__(self, version, data, nbytes):
+        self.version = version
+        self.data = data
+        self.data_nbytes = nbytes
+        self.derived = {}   # name -> object derived from the data (e.g. an index)
+        self.accounted = nbytes     # footprint counted in the cache
+
+    @property
+    def nbytes(self):
+        return self.data_nbytes + sum(getattr(obj, 'nbytes', 0) for obj in self.derived.values())
+
+
+class DataCache:
+    """
+    In-process LRU cache of loaded datasets (one per gunicorn/celery worker process).
+    Entries are stored with a version of their file (e.g. size and modification time), such that
+    a changed file is loaded again, and the least recently used entries are evicted as soon as
+    the memory footprint of all entries exceeds max_bytes. Objects derived from the data of an
+    entry (e.g. indexes) are stored and evicted with the entry and count towards its footprint.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> _Entry
+        self._lock = threading.Lock()
+
+    def get(self, key, version, load):
+        """
+        Get the data of a key from the cache or load (and cache) it.
+        :param key: Key of the data (hashable)
+        :param version: Version of the data, entries with another version are reloaded
+        :param load: Function without arguments that loads the data (pd.DataFrame)
+        :return: Data
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.data
+            self.misses += 1
+
+        data = load()
+        nbytes = int(data.memory_usage(deep=True).sum())
+        with self._lock:
+            self._remove(key)
+            if nbytes <= self.max_bytes:    # larger datasets are not cached at all
+                self._entries[key] = _Entry(version, data, nbytes)
+                self.nbytes += nbytes
+                self._evict()
+        return data
+
+    def derived(self, key, version, name, build):
+        """
+        Get an object derived from the cached data of a key or build (and cache) it.
+        :param key: Key of the data
+        :param version: Version of the data
+        :param name: Name of the derived object
+        :param build: Function of the data that builds the object (with an optional attribute nbytes)
+        :return: Derived object or None if the data (of this version) is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            if name not in entry.derived:
+                entry.derived[name] = build(entry.data)
+            return entry.derived[name]
+
+    def update(self, key):
+        """
+        Update the memory footprint of an entry after its derived objects have grown and evict entries if necessary.
+        :param key: Key of the data
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                nbytes = entry.nbytes
+                self.nbytes += nbytes - entry.accounted
+                entry.accounted = nbytes
+                self._evict()
+
+    def invalidate(self, match):
+        """
+        Remove all entries whose key satisfies a condition.
+        :param match: Function of the key returning True for entries to remove
+        """
+        with self._lock:
+            for key in [key for key in self._entries if match(key)]:
+                self._remove(key)
+
+    def stats(self):
+        """
+        :return: Number of hits, misses and entries and the memory footprint of the cache
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self.nbytes}
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry.accounted
+
+
+data_cache = DataCache(max_bytes=int(os.getenv("DATA_CACHE_MB", 256)) * 1024 * 1024)
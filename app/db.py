@@ -1,3 +1,22 @@
+import sqlalchemy as sa
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
+
+
+def add_missing_columns(model):
+    """
+    Add the columns and indexes of a model which are missing in its existing table
+    (db.create_all only creates missing tables).
+    """
+    table = model.__table__
+    existing = {c['name'] for c in sa.inspect(db.engine).get_columns(table.name)}
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                col_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(sa.text(f"ALTER TABLE {preparer.format_table(table)} "
+                                     f"ADD COLUMN {preparer.format_column(column)} {col_type}"))
+    for index in table.indexes:
+        index.create(db.engine, checkfirst=True)
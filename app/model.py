@@ -39,12 +39,17 @@ class Dataset(db.Model):
     )
     id = db.Column(db.String(UUID_LENGTH), primary_key=True)
     name = db.Column(db.String(DATASET_NAME_LENGTH), nullable=False)
-    owner = db.Column(db.String(UUID_LENGTH), db.ForeignKey('user.id'), nullable=False)
+    owner = db.Column(db.String(UUID_LENGTH), db.ForeignKey('user.id'), nullable=False, index=True)
     description = db.Column(db.Text)
     upload_date = db.Column(db.DateTime)
     label_column = db.Column(db.String)
     prediction_column = db.Column(db.String)
 
+    # Metadata (computed on upload)
+    n_rows = db.Column(db.Integer)
+    n_bytes = db.Column(db.BigInteger)      # size of the stored file
+    columns = db.Column(db.JSON)            # list of dicts with name, dtype and cardinality of each column
+
     def __init__(self, *args, **kwargs):
         super(Dataset, self).__init__(*args, **kwargs)
         self.id = uuid.uuid4().hex  # auto-generate id
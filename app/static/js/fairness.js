@@ -468,8 +468,11 @@ function updateProgress(status_url) {
         // Switch states
         if (state == 'SUCCESS') {
 
-            result = JSON.parse(data['result'])
-            displayResult()
+            // Fetch the result as json (stored in a binary format)
+            $.getJSON(data['result'], {format: 'json'}, function (res) {
+                result = res
+                displayResult()
+            })
 
 
         } else if (state == 'FAILURE') {
@@ -0,0 +1,177 @@
+import sys
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+NGRAM = 3
+
+
+class TableIndex:
+    """
+    Query index of a dataset for the server-side filtering, sorting and pagination of its table.
+    Built lazily per column and kept as long as the dataset is used:
+        - string forms of the column values, factorized into codes of distinct strings,
+          with the rows of each distinct string,
+        - a trigram index of the distinct strings for substring filters,
+        - sort permutations (and ranks) per column and direction.
+    """
+
+    def __init__(self, data, max_ngram_values=100000):
+        """
+        :param data: Dataset
+        :param max_ngram_values: Maximal number of distinct values of a column for its trigram index
+            (the distinct values of larger columns are scanned)
+        """
+        self.data = data
+        self.max_ngram_values = max_ngram_values
+        self._strings = {}  # column -> (distinct strings, rows ordered by string, offsets of the strings)
+        self._ngrams = {}   # column -> trigram -> ids of the distinct strings containing it (or None)
+        self._orders = {}   # (column, ascending) -> permutation of the rows
+        self._ranks = {}    # (column, ascending) -> position of each row in the permutation
+        self._nbytes = 0    # approximate memory footprint of the above
+
+    @property
+    def nbytes(self):
+        """
+        Approximate memory footprint of the index (without the dataset).
+        :rtype: int
+        """
+        return self._nbytes
+
+    def query(self, filters=None, sort=None, ascending=True, offset=0, limit=10):
+        """
+        Filter, sort and paginate the rows of the dataset.
+        :param filters: Dict of column name and substring the string form of the column has to contain or None
+        :param sort: Name of the column to sort by or None (order of the dataset)
+        :param ascending: Sort in ascending order (missing values last in either direction)
+        :param offset: Number of rows to skip
+        :param limit: Maximal number of rows to return
+        :return: Number of rows matching the filters and positions of the rows of the page
+        :rtype: (int, np.ndarray)
+        """
+        rows = None     # all rows
+        for col, pattern in (filters or {}).items():
+            matches = self.contains(col, pattern)
+            rows = matches if rows is None else np.intersect1d(rows, matches, assume_unique=True)
+        total = len(self.data) if rows is None else len(rows)
+        return total, self.page(rows, offset, limit, sort=sort, ascending=ascending)
+
+    def contains(self, col, pattern):
+        """
+        Rows whose value (as string) contains the pattern (literally).
+        :param col: Column name
+        :param pattern: Substring
+        :return: Sorted positions of the rows
+        :rtype: np.ndarray
+        """
+        uniques, rows, offsets = self.strings(col)
+        candidates = self._candidates(col, pattern)
+        if candidates is None:
+            candidates = np.arange(len(uniques))
+        hit = np.fromiter((pattern in uniques[i] for i in candidates), dtype=bool, count=len(candidates))
+        matched = candidates[hit]
+        if len(matched) == 0:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate([rows[offsets[i]:offsets[i + 1]] for i in matched]))
+
+    def strings(self, col):
+        """
+        String forms of a column.
+        :param col: Column name
+        :return: Distinct strings, row positions grouped by distinct string and start of each group
+        :rtype: (np.ndarray, np.ndarray, np.ndarray)
+        """
+        if col not in self._strings:
+            codes, uniques = pd.factorize(self.data[col].astype(str))
+            rows = np.argsort(codes, kind='stable')
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(uniques)))))
+            uniques = np.asarray(uniques, dtype=object)
+            self._strings[col] = (uniques, rows, offsets)
+            self._nbytes += uniques.nbytes + rows.nbytes + offsets.nbytes + sum(sys.getsizeof(v) for v in uniques)
+        return self._strings[col]
+
+    def order(self, col, ascending=True):
+        """
+        Sort permutation of the rows by a column (stable, missing values last).
+        :param col: Column name
+        :param ascending: Sort direction
+        :return: Positions of the rows in sorted order
+        :rtype: np.ndarray
+        """
+        key = (col, ascending)
+        if key not in self._orders:
+            values = pd.Series(self.data[col].to_numpy())
+            self._orders[key] = values.sort_values(ascending=ascending, kind='stable',
+                                                   na_position='last').index.to_numpy()
+            self._nbytes += self._orders[key].nbytes
+        return self._orders[key]
+
+    def rank(self, col, ascending=True):
+        """
+        Position of each row in the sort permutation of a column (see order).
+        :rtype: np.ndarray
+        """
+        key = (col, ascending)
+        if key not in self._ranks:
+            order = self.order(col, ascending)
+            ranks = np.empty(len(order), dtype=np.intp)
+            ranks[order] = np.arange(len(order))
+            self._ranks[key] = ranks
+            self._nbytes += ranks.nbytes
+        return self._ranks[key]
+
+    def page(self, rows, offset, limit, sort=None, ascending=True):
+        """
+        Sort and paginate rows without sorting all of them.
+        :param rows: Sorted positions of the rows or None (all rows)
+        :param offset: Number of rows to skip
+        :param limit: Maximal number of rows to return
+        :param sort: Name of the column to sort by or None
+        :param ascending: Sort direction
+        :return: Positions of the rows of the page
+        :rtype: np.ndarray
+        """
+        n = len(self.data) if rows is None else len(rows)
+        end = min(offset + limit, n)
+        if offset >= end:
+            return np.empty(0, dtype=np.intp)
+        if sort is None:
+            return np.arange(offset, end) if rows is None else rows[offset:end]
+        if rows is None:
+            return self.order(sort, ascending)[offset:end]
+
+        # Select the first rows by their ranks and sort only those
+        ranks = self.rank(sort, ascending)[rows]
+        first = np.argpartition(ranks, end - 1)[:end] if end < n else np.arange(n)
+        first = first[np.argsort(ranks[first])]
+        return rows[first[offset:end]]
+
+    def _candidates(self, col, pattern):
+        # Ids of the distinct strings that contain all trigrams of the pattern (None if all have to be scanned)
+        if len(pattern) < NGRAM:
+            return None
+        if col not in self._ngrams:
+            self._ngrams[col] = self._ngram_index(self.strings(col)[0])
+            if self._ngrams[col] is not None:
+                self._nbytes += sum(sys.getsizeof(gram) + ids.nbytes for gram, ids in self._ngrams[col].items())
+        index = self._ngrams[col]
+        if index is None:
+            return None
+
+        postings = [index.get(pattern[i:i + NGRAM]) for i in range(len(pattern) - NGRAM + 1)]
+        if any(p is None for p in postings):
+            return np.empty(0, dtype=np.intp)
+        candidates = None
+        for p in sorted(postings, key=len):
+            candidates = p if candidates is None else np.intersect1d(candidates, p, assume_unique=True)
+        return candidates
+
+    def _ngram_index(self, uniques):
+        if len(uniques) > self.max_ngram_values:
+            return None
+        postings = defaultdict(list)
+        for i, value in enumerate(uniques):
+            for gram in {value[j:j + NGRAM] for j in range(len(value) - NGRAM + 1)}:
+                postings[gram].append(i)
+        return {gram: np.array(ids, dtype=np.intp) for gram, ids in postings.items()}
@@ -2,7 +2,7 @@ import pandas as pd
 from celery import Task
 from celery.utils.log import get_task_logger
 
-from app.blueprints.util import choose_model, estimate_n_clusters
+from app.blueprints.util import choose_model, estimate_n_clusters, load_data, data_version
 from app.cache import cache
 from app.celery_app import celery_app
 from app.model import Dataset
@@ -11,6 +11,22 @@ from subgroup_detection.fairness import test_model_fairness
 log = get_task_logger(__name__)
 
 
+def load_task_data(data_ref):
+    """
+    Load the dataset of a task, either from a reference to the stored data (dict with id, owner,
+    version of the stored file, see data_version, and optionally the columns to load) or from an
+    inline json payload (str). Datasets loaded from the upload folder are cached in the worker (see load_data).
+    """
+    if isinstance(data_ref, str):
+        return pd.read_json(data_ref)  # deserialize json
+
+    # The file must not have been replaced since the task was started
+    if list(data_version(data_ref['owner'], data_ref['id'])) != list(data_ref['version']):
+        raise ValueError(f"Dataset {data_ref['id']} has changed since the task was started")
+    data = load_data(data_ref['owner'], data_ref['id'], columns=data_ref.get('columns'))
+    return data.copy(deep=False)     # columns added by the analysis do not alter the cached frame
+
+
 class FairnessTask(Task):
     """
     Utility class for user-bound fairness tasks (one at a time).
@@ -58,7 +74,7 @@ class FairnessTask(Task):
 
 
 @celery_app.task(bind=True, base=FairnessTask)
-def fairness_analysis(self, df_json, algorithm, pos_label=1, threshold=0.65, categ_columns=None,
+def fairness_analysis(self, data_ref, algorithm, pos_label=1, threshold=0.65, categ_columns=None,
                       label_column='class', prediction_column='out', param_dict=None, estimate_k=False):
     log.info(f"Starting fairness analysis: algorithm={algorithm}, pos_label={pos_label}, "
              f"threshold={threshold}, categ_columns={categ_columns}")
@@ -68,7 +84,7 @@ def fairness_analysis(self, df_json, algorithm, pos_label=1, threshold=0.65, cat
 
     # Load data
     progress('Loading data ...')
-    data = pd.read_json(df_json)  # deserialize json
+    data = load_task_data(data_ref)
 
     # If estimate_k is True, apply xmeans to get an estimate of the number of clusters k
     if estimate_k:
@@ -85,5 +101,5 @@ def fairness_analysis(self, df_json, algorithm, pos_label=1, threshold=0.65, cat
                                    categ_columns=categ_columns, progress=progress, label_column=label_column,
                                    prediction_column=prediction_column)
 
-    # Return result as json
-    return fair_res.to_json()
+    # Return result in the binary format (see FairnessResult.to_bytes, converted to json on request)
+    return fair_res.to_bytes()
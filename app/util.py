@@ -16,4 +16,13 @@ def get_project_root() -> Path:
     Returns:
         Path: Path to project root
     """
-    return Path(__file__).parent
\ No newline at end of file
+    return Path(__file__).parent
+
+
+def get_upload_folder():
+    """Return the path of the upload folder outside an application context (e.g. in a worker).
+
+    Returns:
+        str: Path to the upload folder (instance/upload next to the project root, see create_app)
+    """
+    return os.path.join(get_project_root().parent, 'instance', 'upload')
@@ -0,0 +1,255 @@
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """Mergeable streaming quantile sketch (hierarchy of compactors as in the MRL/KLL sketches).
+
+    Values are buffered in levels, a value on level h represents 2^h values of the stream.
+    Whenever a level holds more than k values, it is sorted and every other value is
+    promoted to the next level. The sketch is exact as long as at most k values have been
+    added and its memory usage is O(k * log(n / k)).
+    """
+
+    def __init__(self, k=256):
+        """
+        :param int k: Capacity of each level (accuracy of the sketch)
+        """
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._offset = 0    # alternate the promoted values (even/odd positions) between compactions
+
+    def update(self, values):
+        """Add values to the sketch (NaN values are ignored).
+
+        :param array-like values: Numeric values
+        :return: Updated sketch
+        :rtype: QuantileSketch
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) > 0:
+            self.n += len(values)
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self.levels[0] = np.concatenate((self.levels[0], values))
+            self._compact()
+        return self
+
+    def __add__(self, other):
+        """Merge two sketches.
+
+        :param QuantileSketch other: Sketch of another part of the stream
+        :return: Sketch of both parts
+        :rtype: QuantileSketch
+        """
+        res = QuantileSketch(k=max(self.k, other.k))
+        num_levels = max(len(self.levels), len(other.levels))
+        res.levels = [np.concatenate([s.levels[h] for s in (self, other) if h < len(s.levels)])
+                      for h in range(num_levels)]
+        res.n = self.n + other.n
+        res.min = min(self.min, other.min)
+        res.max = max(self.max, other.max)
+        res._compact()
+        return res
+
+    def _compact(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.k:
+                items = np.sort(items)
+                keep = items[len(items) - len(items) % 2:]     # odd item stays on this level
+                promoted = items[self._offset:len(items) - len(keep):2]
+                self._offset = 1 - self._offset
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+            h += 1
+
+    def quantiles(self, q):
+        """Approximate quantiles of the values added so far, i.e., the smallest values with
+        more than a fraction q of all values less than or equal to them.
+
+        :param array-like q: Quantiles (between 0 and 1)
+        :return: Values of the sketch at the given quantiles
+        :rtype: np.ndarray
+        """
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cum_weights = items[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum_weights, np.asarray(q) * cum_weights[-1], side='right')
+        return items[np.clip(idx, 0, len(items) - 1)]
+
+
+class Binning:
+    """Discretization of continuous (high-cardinality numeric) features into quantile or equal-width bins.
+
+    The bins are left-closed ranges between the edges of the binning. After the transformation,
+    each bin is labeled by the closed interval [min, max] of the values observed in it, such that
+    it can be expressed as a conjunctive pattern with the operators '>=' and '<='
+    (see metrics.subgroups_to_cluster_patterns).
+    """
+
+    def __init__(self, n_bins=10, strategy='quantile', max_values=20, sketch_size=256):
+        """
+        :param int n_bins: Number of bins per continuous feature
+        :param str strategy: Either 'quantile' (bins with equal frequency) or 'uniform' (bins with equal width)
+        :param int max_values: Numeric features with more distinct values are binned
+        :param int sketch_size: Capacity of the quantile sketch (see QuantileSketch)
+        """
+        if strategy not in ('quantile', 'uniform'):
+            raise ValueError(f"Unknown binning strategy '{strategy}'")
+        self.n_bins = n_bins
+        self.strategy = strategy
+        self.max_values = max_values
+        self.sketch_size = sketch_size
+        self._distinct = {}
+        self._sketches = {}
+        self.edges_ = None
+
+    def partial_fit(self, data):
+        """Update the cardinality estimates and quantile sketches of the numeric features with a chunk of data.
+
+        :param pd.DataFrame data: Chunk of the dataset
+        :return: Binning
+        :rtype: Binning
+        """
+        for col in data.columns:
+            x = data[col]
+            if not pd.api.types.is_numeric_dtype(x) or pd.api.types.is_bool_dtype(x):
+                continue
+
+            # Track distinct values until the feature is known to have too many
+            distinct = self._distinct.setdefault(col, set())
+            if len(distinct) <= self.max_values:
+                distinct.update(x.dropna().unique().tolist())
+            self._sketches.setdefault(col, QuantileSketch(self.sketch_size)).update(x.values)
+        self.edges_ = None
+        return self
+
+    def fit(self, data):
+        """Fit the binning on the entire dataset.
+
+        :param pd.DataFrame data: Dataset
+        :return: Binning
+        :rtype: Binning
+        """
+        self._distinct, self._sketches = {}, {}
+        return self.partial_fit(data)
+
+    @property
+    def columns(self):
+        """Continuous features that are binned.
+
+        :rtype: list of str
+        """
+        return [col for col, distinct in self._distinct.items() if len(distinct) > self.max_values]
+
+    @property
+    def edges(self):
+        """Inner bin edges per continuous feature (bin i = [edges[i - 1], edges[i]).
+
+        :rtype: dict of (str, np.ndarray)
+        """
+        if self.edges_ is None:
+            self.edges_ = {}
+            for col in self.columns:
+                sketch = self._sketches[col]
+                if self.strategy == 'quantile':
+                    edges = sketch.quantiles(np.linspace(0, 1, self.n_bins + 1)[1:-1])
+                else:
+                    edges = np.linspace(sketch.min, sketch.max, self.n_bins + 1)[1:-1]
+                self.edges_[col] = np.unique(edges[edges > sketch.min])   # no empty first bin
+        return self.edges_
+
+    def bin_index(self, data):
+        """Replace the continuous features by their bin numbers.
+
+        :param pd.DataFrame data: Dataset
+        :return: Dataset with bin numbers (NaN for missing values) and the observed value range per bin
+            (minima and maxima, NaN for empty bins)
+        :rtype: (pd.DataFrame, dict of (str, (np.ndarray, np.ndarray)))
+        """
+        data = data.copy()
+        bounds = {}
+        for col, edges in self.edges.items():
+            if col not in data.columns:
+                continue
+            x = data[col].to_numpy(dtype=float)
+            valid = ~np.isnan(x)
+            idx = np.searchsorted(edges, x[valid], side='right')
+
+            lo, hi = np.full(len(edges) + 1, np.nan), np.full(len(edges) + 1, np.nan)
+            np.fmin.at(lo, idx, x[valid])
+            np.fmax.at(hi, idx, x[valid])
+            bounds[col] = (lo, hi)
+
+            bins = np.full(len(x), np.nan)
+            bins[valid] = idx
+            data[col] = bins
+        return data, bounds
+
+    @staticmethod
+    def merge_bounds(bounds, other):
+        """Merge the observed value ranges per bin of two parts of a dataset.
+
+        :param dict of (str, (np.ndarray, np.ndarray)) bounds: Value ranges per bin of the first part
+        :param dict of (str, (np.ndarray, np.ndarray)) other: Value ranges per bin of the second part
+        :return: Value ranges per bin of both parts
+        :rtype: dict of (str, (np.ndarray, np.ndarray))
+        """
+        merged = dict(bounds)
+        for col, (lo, hi) in other.items():
+            if col in merged:
+                merged[col] = (np.fmin(merged[col][0], lo), np.fmax(merged[col][1], hi))
+            else:
+                merged[col] = (lo, hi)
+        return merged
+
+    def intervals(self, col, bounds, dtype=None):
+        """Label the bins of a continuous feature by the closed interval of their observed values.
+
+        :param str col: Feature name
+        :param dict of (str, (np.ndarray, np.ndarray)) bounds: Observed value ranges per bin
+        :param None or np.dtype dtype: Type of the feature values (integer bounds are kept as int)
+        :return: Interval per bin (None for empty bins)
+        :rtype: np.ndarray
+        """
+        lo, hi = bounds[col]
+        cast = int if dtype is not None and pd.api.types.is_integer_dtype(dtype) else float
+        return np.array([pd.Interval(cast(l), cast(h), closed='both') if l <= h else None
+                         for l, h in zip(lo, hi)], dtype=object)
+
+    def transform(self, data):
+        """Discretize the continuous features of the dataset (bins labeled by intervals, see intervals).
+
+        :param pd.DataFrame data: Dataset
+        :return: Dataset with categorical interval features instead of continuous ones
+        :rtype: pd.DataFrame
+        """
+        binned, bounds = self.bin_index(data)
+        for col in bounds:
+            intervals = self.intervals(col, bounds, dtype=data[col].dtype)
+            present = np.array([i is not None for i in intervals])
+            codes = np.cumsum(present) - 1     # codes of the non-empty bins
+            bins = binned[col].to_numpy()
+            valid = ~np.isnan(bins)
+            cat_codes = np.full(len(bins), -1)
+            cat_codes[valid] = codes[bins[valid].astype(int)]
+            binned[col] = pd.Categorical.from_codes(cat_codes, categories=pd.IntervalIndex(intervals[present]))
+        return binned
+
+    def fit_transform(self, data):
+        """Fit the binning and discretize the continuous features of the dataset.
+
+        :param pd.DataFrame data: Dataset
+        :return: Dataset with categorical interval features instead of continuous ones
+        :rtype: pd.DataFrame
+        """
+        return self.fit(data).transform(data)
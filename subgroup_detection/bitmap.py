@@ -0,0 +1,98 @@
+import numpy as np
+
+# Masks of the parallel (SWAR) popcount of 64-bit words
+_M1, _M2, _M4 = np.uint64(0x5555555555555555), np.uint64(0x3333333333333333), np.uint64(0x0f0f0f0f0f0f0f0f)
+_H01 = np.uint64(0x0101010101010101)
+
+
+class BitmapIndex:
+    """Membership index of a dataset with one packed bitset per (column, value) pair.
+
+    Bit i of a bitset is set iff row i of the dataset has the value in the column. The
+    rows of a conjunctive pattern of attribute-value pairs are the AND of the bitsets
+    of its pairs, and the number of rows is the popcount of the resulting bitset.
+    Bitsets are built on first use and shared by all patterns of an analysis.
+    """
+
+    def __init__(self, data):
+        """
+        :param pd.DataFrame data: Dataset
+        """
+        self.data = data
+        self.n = len(data)
+        self._bitsets = {}
+
+    def bitset(self, col, value):
+        """Rows of the dataset with the given value in a column.
+
+        :param str col: Column name
+        :param obj value: Value of the column
+        :return: Packed bitset (missing values and values not in the column are not set)
+        :rtype: np.ndarray
+        """
+        key = (col, value)
+        if key not in self._bitsets:
+            self._bitsets[key] = self.pack(np.asarray(self.data[col] == value, dtype=bool))
+        return self._bitsets[key]
+
+    def pattern(self, pattern):
+        """Rows of the dataset that match all attribute-value pairs of a pattern.
+
+        :param dict of (str, obj) pattern: Attribute-value pairs
+        :return: Packed bitset (all rows for an empty pattern)
+        :rtype: np.ndarray
+        """
+        bits = self.pack(np.ones(self.n, dtype=bool))
+        for col, value in pattern.items():
+            bits = bits & self.bitset(col, value)
+        return bits
+
+    def pack(self, mask):
+        """Pack a boolean mask of the rows into a bitset (padded to whole 64-bit words).
+
+        :param np.ndarray mask: Boolean mask of length n
+        :return: Packed bitset
+        :rtype: np.ndarray
+        """
+        bits = np.packbits(mask)
+        return np.concatenate((bits, np.zeros(-len(bits) % 8, dtype=np.uint8)))
+
+    def mask(self, bits):
+        """Unpack a bitset into a boolean mask of the rows.
+
+        :param np.ndarray bits: Packed bitset
+        :return: Boolean mask of length n
+        :rtype: np.ndarray
+        """
+        return np.unpackbits(bits, count=self.n).astype(bool)
+
+    @staticmethod
+    def count(bits):
+        """Number of rows in a bitset (or in each bitset of a stack of bitsets).
+
+        :param np.ndarray bits: Packed bitset or bitsets along the last axis
+        :return: Popcount of the bitset(s)
+        :rtype: int or np.ndarray
+        """
+        x = bits.view(np.uint64)
+        x = x - ((x >> np.uint64(1)) & _M1)
+        x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+        x = (x + (x >> np.uint64(4))) & _M4
+        counts = ((x * _H01) >> np.uint64(56)).sum(axis=-1, dtype=np.int64)
+        return int(counts) if counts.ndim == 0 else counts
+
+    def confusion_counts(self, bits, y_true, y_pred):
+        """Count the rows of a bitset per ground-truth and predicted class.
+
+        :param np.ndarray bits: Packed bitset of the rows or bitsets along the last axis
+        :param np.ndarray y_true: Packed bitset of the rows with ground truth 1
+        :param np.ndarray y_pred: Packed bitset of the rows with prediction 1
+        :return: Counts indexed by (class, out), shape = (..., 2, 2)
+        :rtype: np.ndarray
+        """
+        n = self.count(bits)
+        n_true = self.count(bits & y_true)
+        n_pred = self.count(bits & y_pred)
+        n_both = self.count(bits & y_true & y_pred)
+        counts = np.stack([n - n_true - n_pred + n_both, n_pred - n_both, n_true - n_both, n_both], axis=-1)
+        return counts.reshape(np.shape(n) + (2, 2)).astype(np.int64)
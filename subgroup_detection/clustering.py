@@ -1,34 +1,174 @@
 import logging
+import multiprocessing
+from collections import OrderedDict
 
 import pandas as pd
 from lime.lime_tabular import LimeTabularExplainer
-from sklearn.metrics import silhouette_score, davies_bouldin_score, calinski_harabasz_score
 from sklearn.cluster import KMeans
 from sklearn.neighbors import KNeighborsClassifier
+from sklearn.tree import DecisionTreeClassifier
 from pandas import Series, DataFrame
-from shap import KernelExplainer
+from shap import KernelExplainer, TreeExplainer
+from scipy.stats import norm
 import numpy as np
 
 log = logging.getLogger()
 
 
-def validate_clustering(X, labels):
+def validate_clustering(X, labels, mode='exact', sample_size=10000, confidence=0.95, working_memory=64,
+                        random_state=None):
     """
     Compute different cluster validation indices.
+    The silhouette score is computed in chunks of rows with bounded memory usage (mode 'exact') or estimated
+    from a stratified sample of the instances with a confidence interval (mode 'sample'). Davies-Bouldin and
+    Calinski-Harabasz indices are computed exactly from the cluster centroids.
     @param X: Numeric data
     @type X: pd.DataFrame or array
     @param labels: Cluster labels
     @type labels: list of int
-    @return: Series containing CVI values
+    @param mode: Either 'exact' or 'sample'
+    @type mode: str
+    @param sample_size: Number of instances to sample for the silhouette score (mode 'sample')
+    @type sample_size: int
+    @param confidence: Confidence level of the interval of the sampled silhouette score
+    @type confidence: float
+    @param working_memory: Memory ceiling for the distances of a chunk of rows in MiB
+    @type working_memory: int
+    @param random_state: Seed of the sampling
+    @type random_state: None or int
+    @return: Series containing CVI values (and the bounds 'sil_low' and 'sil_high' of the silhouette
+    score's confidence interval in mode 'sample')
     @rtype: Series
     """
-    sil = silhouette_score(X, labels)
-    dbi = davies_bouldin_score(X, labels)
-    chi = calinski_harabasz_score(X, labels)
-    return Series(data={'sil': sil, 'dbi': dbi, 'chi': chi})
+    if mode not in ('exact', 'sample'):
+        raise ValueError(f"Unknown cluster validation mode '{mode}'")
+    X = np.asarray(X, dtype=float)
+    codes, _ = pd.factorize(np.asarray(labels), sort=True)
+    sizes = np.bincount(codes)
+    k = len(sizes)
+    if not 1 < k < len(X):
+        raise ValueError(f"Number of labels is {k}. Valid values are 2 to n_samples - 1 (inclusive)")
+
+    # Centroids and within-cluster dispersion in one pass
+    sums = np.stack([np.bincount(codes, weights=X[:, j], minlength=k) for j in range(X.shape[1])], axis=1)
+    centroids = sums / sizes[:, np.newaxis]
+    sq_dists = np.sum((X - centroids[codes]) ** 2, axis=1)
+    dbi = _davies_bouldin(centroids, np.bincount(codes, weights=np.sqrt(sq_dists)) / sizes)
+    chi = _calinski_harabasz(centroids, sizes, X.mean(axis=0), sq_dists.sum(), len(X))
+
+    if mode == 'exact':
+        sil = _silhouette_samples(X, codes, sizes, np.arange(len(X)), working_memory).mean()
+        return Series(data={'sil': sil, 'dbi': dbi, 'chi': chi})
+
+    # Stratified sample (proportional allocation, at least 2 instances per cluster if possible)
+    rng = np.random.default_rng(random_state)
+    alloc = np.minimum(sizes, np.maximum(np.round(sample_size * sizes / len(X)).astype(int), 2))
+    order = np.argsort(codes, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    idx = [order[start + rng.choice(size, n, replace=False)] for start, size, n in zip(starts, sizes, alloc)]
+    s = _silhouette_samples(X, codes, sizes, np.concatenate(idx), working_memory)
+
+    # Stratified mean and its standard error (with finite population correction)
+    strata = np.split(s, np.cumsum(alloc)[:-1])
+    weights = sizes / len(X)
+    sil = sum(w * st.mean() for w, st in zip(weights, strata))
+    var = sum(w ** 2 * (1 - n / size) * st.var(ddof=1) / n
+              for w, st, n, size in zip(weights, strata, alloc, sizes) if n > 1)
+    z = norm.ppf(0.5 + confidence / 2)
+    return Series(data={'sil': sil, 'dbi': dbi, 'chi': chi,
+                        'sil_low': sil - z * np.sqrt(var), 'sil_high': sil + z * np.sqrt(var)})
+
+
+def _silhouette_samples(X, codes, sizes, idx, working_memory):
+    """
+    Silhouette coefficients of the instances idx (as in sklearn.metrics.silhouette_samples). The distances
+    to all instances are computed for chunks of idx that fit into the working memory.
+    @param X: Numeric data
+    @type X: np.ndarray
+    @param codes: Cluster codes (0 to k - 1)
+    @type codes: np.ndarray
+    @param sizes: Cluster sizes
+    @type sizes: np.ndarray
+    @param idx: Instances to compute the coefficients for
+    @type idx: np.ndarray
+    @param working_memory: Memory ceiling in MiB
+    @type working_memory: int
+    @return: Silhouette coefficients of the instances idx
+    @rtype: np.ndarray
+    """
+    order = np.argsort(codes, kind='stable')
+    X_sorted = X[order]
+    sq_norms = np.sum(X_sorted ** 2, axis=1)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    chunk_size = max(1, int(working_memory * 2 ** 20 // (8 * len(X))))    # one distance matrix per chunk
+
+    s = np.empty(len(idx))
+    for lo in range(0, len(idx), chunk_size):
+        chunk = idx[lo:lo + chunk_size]
+        x = X[chunk]
+        # Distances to all instances in place, i.e., without temporaries of the size of the distance matrix
+        dists = x @ X_sorted.T
+        dists *= -2
+        dists += sq_norms[np.newaxis]
+        dists += np.sum(x ** 2, axis=1)[:, np.newaxis]
+        np.maximum(dists, 0, out=dists)
+        np.sqrt(dists, out=dists)
+        dist_sums = np.add.reduceat(dists, starts, axis=1)    # per cluster
+        del dists
+
+        own = codes[chunk]
+        rows = np.arange(len(chunk))
+        own_size = sizes[own]
+        a = dist_sums[rows, own] / np.maximum(own_size - 1, 1)
+        dist_sums[rows, own] = np.inf
+        b = np.min(dist_sums / sizes, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s_chunk = (b - a) / np.maximum(a, b)
+        s[lo:lo + chunk_size] = np.where(own_size > 1, np.nan_to_num(s_chunk), 0)   # 0 for singleton clusters
+    return s
+
+
+def _davies_bouldin(centroids, intra_dists):
+    """
+    Davies-Bouldin index from the cluster centroids and mean distances of the instances to their centroid.
+    @param centroids: Cluster centroids, shape = (k, num_features)
+    @type centroids: np.ndarray
+    @param intra_dists: Mean distance of the instances of each cluster to its centroid
+    @type intra_dists: np.ndarray
+    @return: Davies-Bouldin index
+    @rtype: float
+    """
+    centroid_dists = np.sqrt(np.maximum(np.sum((centroids[:, np.newaxis] - centroids[np.newaxis]) ** 2, axis=2), 0))
+    if np.allclose(intra_dists, 0) or np.allclose(centroid_dists, 0):
+        return 0.0
+    centroid_dists[centroid_dists == 0] = np.inf
+    combined = (intra_dists[:, np.newaxis] + intra_dists[np.newaxis]) / centroid_dists
+    return float(np.mean(np.max(combined, axis=1)))
 
 
-def explain_clustering_shap(model, data, sample_frac=0.1, min_sample_size=10):
+def _calinski_harabasz(centroids, sizes, mean, within, n):
+    """
+    Calinski-Harabasz index from the cluster centroids and the within-cluster dispersion.
+    @param centroids: Cluster centroids, shape = (k, num_features)
+    @type centroids: np.ndarray
+    @param sizes: Cluster sizes
+    @type sizes: np.ndarray
+    @param mean: Mean of all instances
+    @type mean: np.ndarray
+    @param within: Sum of the squared distances of the instances to their centroid
+    @type within: float
+    @param n: Number of instances
+    @type n: int
+    @return: Calinski-Harabasz index
+    @rtype: float
+    """
+    k = len(sizes)
+    between = np.sum(sizes * np.sum((centroids - mean) ** 2, axis=1))
+    return 1.0 if within == 0 else float(between * (n - k) / (within * (k - 1)))
+
+
+def explain_clustering_shap(model, data, sample_frac=0.1, min_sample_size=10, surrogate=None, n_jobs=None,
+                            max_depth=8, random_state=None):
     """
     Explain a given clustering model using SHAP.
     :param model: Clustering model.
@@ -36,39 +176,120 @@ def explain_clustering_shap(model, data, sample_frac=0.1, min_sample_size=10):
     :param sample_frac: Fraction of instances of a cluster to sample for explanation of the clustering
     :param min_sample_size: Minimal number of instances (if possible) to sample from a cluster for
         clustering explanation.
+    :param surrogate: None to explain the model (or a k-NN surrogate if the model cannot predict inputs)
+        with KernelExplainer, or 'tree' to explain a decision tree surrogate with the exact TreeExplainer.
+    :param n_jobs: Number of worker processes to explain the clusters in parallel (KernelExplainer) or None
+    :param max_depth: Maximal depth of the decision tree surrogate (the cost of TreeExplainer grows with the
+        number of leaves) or None (unbounded)
+    :param random_state: Seed of the sampled instances or None
     :return: SHAP values for each instance grouped by cluster
     """
-    cluster_shap = {}
     labels = model.labels_
     n_clusters = labels.max() + 1
 
-    # Train a kmeans model for KernelExplainer background data
-    kmeans = KMeans(n_clusters=n_clusters).fit(data)
+    # KMeans summary of the data as background data of the explainers
+    background = shap_background(data, n_clusters)
+
+    # Sample instances of each cluster
+    rng = np.random.RandomState(random_state)
+    samples = {c: sample_cluster(data, labels, c, sample_frac=sample_frac, min_sample_size=min_sample_size,
+                                 random_state=rng)
+               for c in range(0, n_clusters)}
+
+    if surrogate == 'tree':
+        # Explain all clusters (one-vs-all) with the class probabilities of a single tree
+        tree = DecisionTreeClassifier(max_depth=max_depth, random_state=0).fit(data, labels)
+        explainer = TreeExplainer(tree, data=background, feature_perturbation='interventional',
+                                  model_output='probability')
+        shap_values = explainer.shap_values(pd.concat(samples.values()))
+        splits = np.cumsum([len(s) for s in samples.values()])[:-1]
+        classes = list(tree.classes_)
+        return {c: DataFrame(np.split(_class_shap_values(shap_values, classes.index(c)), splits)[i],
+                             columns=data.columns)
+                for i, c in enumerate(samples)}
+    elif surrogate is not None:
+        raise ValueError(f"Unknown surrogate model '{surrogate}'")
+
+    # If the model is able to predict inputs, use this for KernelExplainer
+    # Otherwise, train a k-NN model (once) to predict cluster membership
+    if can_predict(model):
+        predictor = model
+    else:
+        predictor = KNeighborsClassifier(n_neighbors=7, weights='distance').fit(data, labels)
 
     # Iterate over all clusters and explain them (one-vs-all)
-    for c in range(0, n_clusters):
+    if n_jobs is None:
+        return {c: _explain_cluster_shap(predictor, background, c, samples[c]) for c in samples}
+    with multiprocessing.Pool(n_jobs, initializer=_init_shap_worker, initargs=(predictor, background)) as pool:
+        return dict(zip(samples, pool.starmap(_shap_worker, samples.items())))
+
+
+def _class_shap_values(shap_values, i):
+    """
+    SHAP values of the i-th class of a multi-output explanation, given as a list with one (n, d) array per class
+    (shap < 0.45) or as a single (n, d, k) array.
+    """
+    return shap_values[i] if isinstance(shap_values, list) else shap_values[..., i]
+
+
+# Background data of SHAP per dataset (hash) and number of clusters
+_background_cache = OrderedDict()
+
+
+def shap_background(data, n_clusters, maxsize=8):
+    """
+    Summarize the data by the cluster centers of KMeans as background data for SHAP explainers.
+    The summaries of the most recently used datasets are cached.
+    :param data: The numerical dataset used to train the clustering model (preprocessed) without labels.
+    :param n_clusters: Number of clusters (background instances)
+    :param maxsize: Maximal number of cached summaries
+    :return: Background data
+    """
+    key = (int(pd.util.hash_pandas_object(data, index=False).sum()), tuple(data.columns), n_clusters)
+    if key in _background_cache:
+        _background_cache.move_to_end(key)
+    else:
+        kmeans = KMeans(n_clusters=n_clusters).fit(data)
+        _background_cache[key] = DataFrame(kmeans.cluster_centers_, columns=data.columns)
+        if len(_background_cache) > maxsize:
+            _background_cache.popitem(last=False)
+    return _background_cache[key]
+
+
+class _OneVsRest:
+    """
+    Membership of a single cluster (1) vs. all other clusters (0) predicted by a clustering
+    or classification model (picklable, in contrast to a lambda, for worker processes).
+    """
+
+    def __init__(self, predictor, c):
+        self.predictor = predictor
+        self.c = c
+
+    def __call__(self, X):
+        return (self.predictor.predict(X) == self.c).astype(int)
+
+    def predict_proba(self, X):
+        member = self.predictor.predict(X) == self.c
+        return np.column_stack((~member, member)).astype(float)
+
+
+def _explain_cluster_shap(predictor, background, c, samples):
+    explainer = KernelExplainer(_OneVsRest(predictor, c), background)
+    return DataFrame(explainer.shap_values(samples), columns=background.columns)
+
+
+# Predictor and background data of a SHAP worker process
+_shap_worker_args = None
 
-        # If the model is able to predict inputs, use this for KernelExplainer
-        # Otherwise, train a k-NN model to predict cluster membership
-        if can_predict(model):
-            f = lambda X: (model.predict(X) == c).astype(int)  # one-vs-all approach (cluster ec vs rest)
-        else:
-            knn = KNeighborsClassifier(n_neighbors=7, weights='distance').fit(data, labels)
-            f = lambda X: (knn.predict(X) == c).astype(int)
 
-        # Sample instances of cluster c
-        samples = sample_cluster(data,
-                                 labels,
-                                 c,
-                                 sample_frac=sample_frac,
-                                 min_sample_size=min_sample_size)
+def _init_shap_worker(predictor, background):
+    global _shap_worker_args
+    _shap_worker_args = (predictor, background)
 
-        # Explain cluster c
-        explainer = KernelExplainer(f, DataFrame(kmeans.cluster_centers_, columns=data.columns))
-        shap_values = explainer.shap_values(samples)
-        cluster_shap[c] = DataFrame(shap_values, columns=data.columns)
 
-    return cluster_shap
+def _shap_worker(c, samples):
+    return _explain_cluster_shap(*_shap_worker_args, c, samples)
 
 
 def patterns_from_cluster_shap(cluster_shap, data, dataX, labels, shap_threshold=0.1, prefix_sep='#'):
@@ -92,123 +313,266 @@ def patterns_from_cluster_shap(cluster_shap, data, dataX, labels, shap_threshold
 
         # For each feature with mean SHAP value above the shap_threshold,
         # extract a pattern of the form 'feature =/!= value'
-        patterns = []
-        for fn in mean_shap_vals[mean_shap_vals > shap_threshold].keys():
-
-            # Split the feature names according to the prefix_sep used in one-hot-encoding the data
-            split = fn.split(prefix_sep, maxsplit=1)
-            col = split[0]
-
-            if len(split) == 1:  # not one-hot-encoded feature (not categorical)
-                args, _ = np.unique(cdata[col], return_counts=True)
-                min_val, max_val = args[0], args[-1]
-                min_global, max_global = data[col].min(), data[col].max()
-
-                # Define range constraint
-                if min_val == max_val:
-                    patterns.append((col, '=', min_val))
-                elif min_val == min_global and max_val == max_global:
-                    pass   # no pattern added as it would be true for any value
-                elif min_val == min_global:
-                    patterns.append((col, '<=', max_val))
-                elif max_val == max_global:
-                    patterns.append((col, '>=', min_val))
-                else:
-                    patterns.append((col, '>=', min_val))
-                    patterns.append((col, '<=', max_val))
-            elif len(split) == 2:  # one-hot-encoded feature
-                val = pd.Series(data=split[1]).astype(cdata[col].dtype).iloc[0]  # parse split[1] (str) to original type
-                argmax = np.bincount(cluster_data[fn]).argmax()     # argmax is 0 or 1 (False or True)
-
-                # If the one-hot-encoded feature is binary and the condition negated (argmax=0),
-                # find the counter part (e.g. sex#M==0 --> sex != M --> sex=F).
-                if argmax == 0:
-                    unq = np.unique(data[col])  # unique values for original column (e.g. sex --> [M, F])
-                    if len(unq) == 2:
-                        counter_val = unq[0] if unq[1] == val else unq[1]
-                        patterns.append((col, '=', counter_val))
-                    else:
-                        patterns.append((col, '!=', val))
-                else:
-                    patterns.append((col, '=', val))
+        patterns = _feature_patterns(mean_shap_vals[mean_shap_vals > shap_threshold].keys(), data, cdata,
+                                     cluster_data, prefix_sep)
+
         # Store patterns for cluster c
         cluster_patterns[c] = patterns
 
     return cluster_patterns
 
 
-def explain_clustering_lime(model, data, sample_frac=0.01, min_sample_size=5, prefix_sep='#'):
-    n_feat = len(data.columns)
+def _feature_patterns(features, data, cdata, cluster_data, prefix_sep='#'):
+    """
+    Extract a pattern of the form 'feature =/!=/<=/>= value' for each of the given features.
+    :param features: Feature names of the preprocessed dataset.
+    :param data: The original dataset (not preprocessed).
+    :param cdata: Instances of the cluster in the original dataset.
+    :param cluster_data: Instances of the cluster in the preprocessed dataset.
+    :param prefix_sep: Delimiter used in one-hot encoding the data.
+    :return: List of patterns
+    """
+    patterns = []
+    for fn in features:
+
+        # Split the feature names according to the prefix_sep used in one-hot-encoding the data
+        split = fn.split(prefix_sep, maxsplit=1)
+        col = split[0]
+
+        if len(split) == 1:  # not one-hot-encoded feature (not categorical)
+            args, _ = np.unique(cdata[col], return_counts=True)
+            min_val, max_val = args[0], args[-1]
+            min_global, max_global = data[col].min(), data[col].max()
+
+            # Define range constraint
+            if min_val == max_val:
+                patterns.append((col, '=', min_val))
+            elif min_val == min_global and max_val == max_global:
+                pass   # no pattern added as it would be true for any value
+            elif min_val == min_global:
+                patterns.append((col, '<=', max_val))
+            elif max_val == max_global:
+                patterns.append((col, '>=', min_val))
+            else:
+                patterns.append((col, '>=', min_val))
+                patterns.append((col, '<=', max_val))
+        elif len(split) == 2:  # one-hot-encoded feature
+            val = pd.Series(data=split[1]).astype(cdata[col].dtype).iloc[0]  # parse split[1] (str) to original type
+            argmax = np.bincount(cluster_data[fn].astype(int)).argmax()     # argmax is 0 or 1 (False or True)
+
+            # If the one-hot-encoded feature is binary and the condition negated (argmax=0),
+            # find the counter part (e.g. sex#M==0 --> sex != M --> sex=F).
+            if argmax == 0:
+                unq = np.unique(data[col])  # unique values for original column (e.g. sex --> [M, F])
+                if len(unq) == 2:
+                    counter_val = unq[0] if unq[1] == val else unq[1]
+                    patterns.append((col, '=', counter_val))
+                else:
+                    patterns.append((col, '!=', val))
+            else:
+                patterns.append((col, '=', val))
+
+    # Several indicators of a column may yield the same pattern (e.g. sex#M==0 and sex#F==1)
+    return list(dict.fromkeys(patterns))
+
+
+def patterns_from_cluster_tree(data, labels, max_depth=3, min_samples_leaf=0.01, categ_columns=None,
+                               prefix_sep='#', random_state=0):
+    """
+    Extract patterns (rules) for each cluster from a shallow multiclass decision tree trained to predict the
+    cluster labels from the original features (one-hot-encoded categorical features, no scaling).
+    Each cluster is described by the root-to-leaf path of the leaf with the most instances of the cluster
+    among the leaves in which it is the majority (or among all leaves if there is none).
+    :param data: The original dataset (not preprocessed) without ground-truth and predicted labels.
+    :param labels: Clustering labels.
+    :param max_depth: Maximal depth of the tree, i.e., maximal number of splits in a pattern.
+    :param min_samples_leaf: Minimal number (int) or fraction (float) of instances in a leaf.
+    :param categ_columns: List of categorical columns or None. If None, then all columns
+        with type 'category' or 'object' are encoded.
+    :param prefix_sep: Delimiter to use for one-hot encoding.
+    :param random_state: Seed of the decision tree.
+    :return: Set of patterns for each cluster
+    """
+    labels = np.asarray(labels)
+    if categ_columns is None:
+        categ_columns = data.select_dtypes(include=['object', 'category']).columns.tolist()
+
+    # One-hot-encode categorical features, remember the original column and value of each indicator
+    indicators = {}
+    for col in categ_columns:
+        for val in data[col].dropna().unique():
+            indicators[f"{col}{prefix_sep}{val}"] = (col, val)
+    X = pd.get_dummies(data, columns=categ_columns, prefix_sep=prefix_sep)
+    tree = DecisionTreeClassifier(max_depth=max_depth, min_samples_leaf=min_samples_leaf,
+                                  random_state=random_state).fit(X, labels)
+
+    # Path constraints of all leaves: (feature, is_right_child, threshold)
+    t = tree.tree_
+    paths = {0: []}
+    leaves = []
+    for node in range(t.node_count):    # parents always precede their children
+        if t.children_left[node] == t.children_right[node]:
+            leaves.append(node)
+            continue
+        split = (X.columns[t.feature[node]], t.threshold[node])
+        paths[t.children_left[node]] = paths[node] + [split + (False,)]
+        paths[t.children_right[node]] = paths[node] + [split + (True,)]
+
+    # Choose the leaf of each cluster
+    counts = t.value[leaves, 0]     # (weighted) instances per leaf and class
+    majority = counts.argmax(axis=1)
+    cluster_patterns = {}
+    for i, c in enumerate(tree.classes_):
+        if c < 0:
+            continue    # outliers
+        candidates = np.where(majority == i, counts[:, i], -1)
+        leaf = leaves[int(np.argmax(candidates if candidates.max() > 0 else counts[:, i]))]
+        cluster_patterns[c] = _path_to_pattern(paths[leaf], data, indicators)
+
+    return cluster_patterns
+
+
+def _path_to_pattern(path, data, indicators):
+    """
+    Transform the splits of a root-to-leaf path into a conjunctive pattern. Thresholds of numeric features are
+    replaced by the closest observed values (x <= t --> x <= max value <= t, x > t --> x >= min value > t).
+    """
+    lower, upper, equal, not_equal = {}, {}, {}, {}
+    for fn, threshold, right in path:
+        if fn in indicators:
+            col, val = indicators[fn]
+            if right:
+                equal[col] = val
+            else:
+                not_equal.setdefault(col, []).append(val)
+        elif right:
+            values = data[fn].values
+            lower[fn] = max(lower.get(fn, -np.inf), values[values > threshold].min())
+        else:
+            values = data[fn].values
+            upper[fn] = min(upper.get(fn, np.inf), values[values <= threshold].max())
+
+    # If all but one value of a categorical feature are excluded, use the remaining one (e.g. sex != M --> sex = F)
+    for col, vals in not_equal.items():
+        remaining = [val for val in data[col].dropna().unique() if val not in vals]
+        if col not in equal and len(remaining) == 1:
+            equal[col] = remaining[0]
+
+    pattern = [(col, '=', val) for col, val in equal.items()]
+    pattern += [(col, '!=', val) for col, vals in not_equal.items() if col not in equal for val in vals]
+    for col in list(lower) + [col for col in upper if col not in lower]:
+        if col in lower and col in upper and lower[col] == upper[col]:
+            pattern.append((col, '=', lower[col]))
+            continue
+        if col in lower:
+            pattern.append((col, '>=', lower[col]))
+        if col in upper:
+            pattern.append((col, '<=', upper[col]))
+    return pattern
+
+
+def explain_clustering_lime(model, data, sample_frac=0.01, min_sample_size=5, prefix_sep='#', n_jobs=None,
+                            random_state=None, chunk_size=16):
+    """
+    Explain a given clustering model using LIME.
+    :param model: Clustering model.
+    :param data: The numerical dataset used to train the clustering model (preprocessed) without labels.
+    :param sample_frac: Fraction of instances of a cluster to sample for explanation of the clustering
+    :param min_sample_size: Minimal number of instances (if possible) to sample from a cluster for
+        clustering explanation.
+    :param prefix_sep: Delimiter used in one-hot encoding the data (marks the categorical features).
+    :param n_jobs: Number of worker processes to explain the sampled instances in parallel or None
+    :param random_state: Seed of the sampled instances and the perturbations of LIME or None
+    :param chunk_size: Number of instances explained by the same LIME explainer (one chunk per task of a worker)
+    :return: Mean LIME weight of each feature grouped by cluster
+    """
     labels = model.labels_
     n_clusters = labels.max() + 1
     cat_feat = [i for i, col in enumerate(data.columns) if prefix_sep in col]
-    explainer = LimeTabularExplainer(data.values,
-                                     feature_names=data.columns,
+
+    # If the model is able to predict inputs, use this for LimeTabularExplainer
+    # Otherwise, train a k-NN model (once) to predict cluster membership
+    if can_predict(model):
+        predictor = model
+    else:
+        predictor = KNeighborsClassifier(n_neighbors=7, weights='distance').fit(data.values, labels)
+
+    # Sample instances of each cluster
+    rng = np.random.RandomState(random_state)
+    samples = [(c, row) for c in range(0, n_clusters)
+               for row in sample_cluster(data, labels, c, sample_frac=sample_frac,
+                                         min_sample_size=min_sample_size, random_state=rng).values]
+
+    # Explain the sampled instances (one-vs-all) in chunks and accumulate the weights of the features per cluster.
+    # Each chunk is explained with its own explainer seeded by the number of the chunk, i.e., the perturbations
+    # do not depend on the worker that explains the chunk.
+    chunks = [(None if random_state is None else random_state + k, samples[i:i + chunk_size])
+              for k, i in enumerate(range(0, len(samples), chunk_size))]
+    worker_args = (data.values, list(data.columns), cat_feat, predictor)
+    if n_jobs is None:
+        results = [_explain_chunk_lime(*worker_args, chunk) for chunk in chunks]
+    else:
+        with multiprocessing.Pool(n_jobs, initializer=_init_lime_worker, initargs=worker_args) as pool:
+            results = pool.map(_lime_worker, chunks, chunksize=1)
+    results = [w for chunk_results in results for w in chunk_results]
+    clusters = np.array([c for c, _ in samples], dtype=int)
+    weights = np.zeros((n_clusters, len(data.columns)))
+    np.add.at(weights, clusters, np.reshape(results, (len(samples), len(data.columns))))
+    counts = np.bincount(clusters, minlength=n_clusters)
+
+    return {c: Series(weights[c] / max(counts[c], 1), index=data.columns) for c in range(0, n_clusters)}
+
+
+def _explain_chunk_lime(values, feature_names, cat_feat, predictor, chunk):
+    seed, samples = chunk
+    explainer = LimeTabularExplainer(values,
+                                     feature_names=feature_names,
                                      discretize_continuous=True,
-                                     categorical_features=cat_feat)
-
-    cluster_lime = {}
-    for c in range(0, n_clusters):
-        # Get data of cluster c
-        indices = (labels == c).astype(int)
-        cdata = pd.DataFrame(data.values[indices.astype(bool)], columns=data.columns)
-        samples = sample_cluster(data,
-                                 labels,
-                                 c,
-                                 sample_frac=sample_frac,
-                                 min_sample_size=min_sample_size)
-
-        # If the model is able to predict inputs, use this for LimeTabularExplainer
-        # Otherwise, train a k-NN model to predict cluster membership
-        # Predict probability for class 1 (=[0,1]) or 0 (=[1,0])
-        if can_predict(model):
-            f = lambda X: np.array([[0, 1] if b else [1, 0] for b in model.predict(X) == c])    # one-vs-rest
-        else:
-            knn = KNeighborsClassifier(n_neighbors=7, weights='distance').fit(data, labels)
-            f = lambda X: np.array([[0, 1] if b else [1, 0] for b in knn.predict(X) == c])
-
-        # Explain sample instances of cluster c
-        lime = {}
-        exps = []
-        for _, row in samples.iterrows():
-            exp = explainer.explain_instance(row, f)
-            print(exp.as_list())
-            for k, v in exp.as_list:
-                lime[k] += v
-            exps.append(exp)
-        # lime = lime / len(samples)
-        print(lime)#, np.where(lime > 0.1))
-        # idx = np.where(lime > 0.1)
-        # print(cdata.columns[idx])
-        # for col in cdata.columns[idx].values:
-        #     print(col, np.unique(cdata[col], return_counts=True))
-        cluster_lime[c] = lime
-
-    return cluster_lime
+                                     categorical_features=cat_feat,
+                                     random_state=seed)
+    return [_explain_instance_lime(explainer, predictor, c, row) for c, row in samples]
+
+
+def _explain_instance_lime(explainer, predictor, c, row):
+    exp = explainer.explain_instance(row, _OneVsRest(predictor, c).predict_proba, num_features=len(row))
+    w = np.zeros(len(row))
+    for feature, weight in exp.as_map()[1]:
+        w[feature] = weight
+    return w
+
+
+# Data and predictor of a LIME worker process
+_lime_worker_args = None
+
+
+def _init_lime_worker(values, feature_names, cat_feat, predictor):
+    global _lime_worker_args
+    _lime_worker_args = (values, feature_names, cat_feat, predictor)
+
+
+def _lime_worker(chunk):
+    # The explainers are built in the worker, as their kernel function cannot be pickled
+    return _explain_chunk_lime(*_lime_worker_args, chunk)
 
 
 def patterns_from_cluster_lime(cluster_lime, data, dataX, labels, lime_threshold=0.01, prefix_sep='#'):
+    """
+    Extract patterns (rules) from the LIME explanations of the clustering model.
+    :param cluster_lime: Mean LIME weight of each feature grouped by cluster.
+    :param data: The original dataset (not preprocessed).
+    :param dataX: The numerical dataset used to train the clustering model (preprocessed) without labels.
+    :param labels: Clustering labels.
+    :param lime_threshold: Minimal mean LIME weight of a feature to be considered for a pattern.
+    :param prefix_sep: Delimiter used in one-hot encoding the data.
+    :return: Set of patterns for each cluster
+    """
     cluster_patterns = {}
     for c in cluster_lime:
         lime = cluster_lime[c]
         cdata = data[labels == c]
-        cdataX = DataFrame(dataX.values[labels == c], columns=dataX.columns)
-
-        patterns = []
-        idx = np.where(lime >= lime_threshold)
-        for fn in cdataX.columns[idx].values:
-
-            # Split the feature names according to the prefix_sep used in one-hot-encoding the data
-            split = fn.split(prefix_sep, maxsplit=1)
-            col = split[0]
-
-            if len(split) == 1:
-                pass
-            elif len(split) == 2:
-                print(col, split[1], np.unique(cdata[col], return_counts=True))
-
-        #
-        # cluster_patterns[c] = ...
+        cluster_data = DataFrame(dataX.values[labels == c], columns=dataX.columns)
+        cluster_patterns[c] = _feature_patterns(lime[lime >= lime_threshold].keys(), data, cdata, cluster_data,
+                                                prefix_sep)
     return cluster_patterns
 
 
@@ -217,13 +581,13 @@ def can_predict(model):
     return callable(predict_op)
 
 
-def sample_cluster(data, labels, c, sample_frac=0.1, min_sample_size=10):
+def sample_cluster(data, labels, c, sample_frac=0.1, min_sample_size=10, random_state=None):
     indices = (labels == c).astype(int)
     cdata = DataFrame(data.values[indices.astype(bool)], columns=data.columns)
-    samples = cdata.sample(frac=sample_frac)
+    samples = cdata.sample(frac=sample_frac, random_state=random_state)
     if len(samples) < min_sample_size:
         if len(cdata) <= min_sample_size:
             samples = cdata
         else:
-            samples = cdata.sample(n=min_sample_size)
+            samples = cdata.sample(n=min_sample_size, random_state=random_state)
     return samples
@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+
+
+class ClusterValueCounts:
+    """Cluster x value contingency tables for all features of a clustered dataset.
+
+    Every feature column is factorized to integer codes once and the value counts
+    of all clusters are stored side by side in a single count matrix with one row
+    per cluster. The columns of the matrix are the concatenated (sorted) distinct
+    values of all features, i.e., the values of feature ``columns[j]`` occupy the
+    matrix columns ``offsets[j]:offsets[j + 1]``.
+
+    Outliers (cluster label < 0) are not part of the cluster rows, but they are
+    included in the value totals and the number of rows ``n``. Missing values
+    (NaN) are not stored as a value, but they are included in the cluster sizes,
+    i.e., their counts are the differences to the sizes (see missing_counts). The
+    entropy functions count them as a value of their own, such that the value
+    frequencies of a cluster sum up to one.
+    """
+
+    def __init__(self, columns, values, counts, totals, sizes, n):
+        """
+        :param list of str columns: Feature names
+        :param list of np.ndarray values: Sorted distinct values of each feature
+        :param np.ndarray counts: Value counts per cluster, shape = (num_clusters, num_values)
+        :param np.ndarray totals: Value counts over all rows (incl. outliers), shape = (num_values,)
+        :param np.ndarray sizes: Number of rows per cluster, shape = (num_clusters,)
+        :param int n: Number of rows (incl. outliers)
+        """
+        self.columns = list(columns)
+        self.values = list(values)
+        self.counts = counts
+        self.totals = totals
+        self.sizes = sizes
+        self.n = n
+        self.offsets = np.concatenate(([0], np.cumsum([len(v) for v in self.values]))).astype(np.int64)
+
+    @classmethod
+    def from_data(cls, data, columns=None, cluster_column='cluster'):
+        """Count the values of all features per cluster.
+
+        :param pd.DataFrame data: Dataset with one additional column containing the clustering labels.
+        :param None or list of str columns: Features to count. If None, all columns except the
+            cluster column are used.
+        :param str cluster_column: Name of the column with the clustering labels
+        :return: Contingency tables of the dataset
+        :rtype: ClusterValueCounts
+        """
+        if columns is None:
+            columns = data.columns.drop(cluster_column)
+        labels = np.asarray(data[cluster_column], dtype=np.int64)
+        num_clusters = max(int(labels.max()) + 1, 0) if len(labels) > 0 else 0
+        clustered = labels >= 0
+        sizes = np.bincount(labels[clustered], minlength=num_clusters)
+
+        # Factorize every feature once (sorted codes, NaN --> -1)
+        codes, values = [], []
+        for col in columns:
+            c, v = pd.factorize(data[col], sort=True)
+            codes.append(c)
+            values.append(np.asarray(v))
+        res = cls(columns, values, None, None, sizes, len(labels))
+
+        # Count (cluster, value) pairs for all features into one shared matrix
+        num_values = res.offsets[-1]
+        counts = np.zeros((num_clusters, num_values), dtype=np.int64)
+        totals = np.zeros(num_values, dtype=np.int64)
+        for j, c in enumerate(codes):
+            lo, hi = res.offsets[j], res.offsets[j + 1]
+            width = hi - lo
+            valid = c >= 0
+            totals[lo:hi] = np.bincount(c[valid], minlength=width)
+            valid &= clustered
+            flat = labels[valid] * width + c[valid]
+            counts[:, lo:hi] = np.bincount(flat, minlength=num_clusters * width).reshape(num_clusters, width)
+
+        res.counts = counts
+        res.totals = totals
+        return res
+
+    @classmethod
+    def from_chunks(cls, chunks, columns=None, cluster_column='cluster'):
+        """Count the values of all features per cluster incrementally over chunks of a dataset.
+
+        :param Iterable of pd.DataFrame chunks: Chunks of the dataset, each with a column
+            containing the clustering labels.
+        :param None or list of str columns: Features to count. If None, all columns except the
+            cluster column are used.
+        :param str cluster_column: Name of the column with the clustering labels
+        :return: Contingency tables of the entire dataset
+        :rtype: ClusterValueCounts
+        """
+        res = None
+        for chunk in chunks:
+            counts = cls.from_data(chunk, columns=columns, cluster_column=cluster_column)
+            res = counts if res is None else res + counts
+        if res is None:
+            raise ValueError("Cannot count values of an empty sequence of chunks")
+        return res
+
+    @classmethod
+    def from_csv(cls, filepath_or_buffer, labels=None, columns=None, cluster_column='cluster', chunksize=100000,
+                 binning=None, **kwargs):
+        """Count the values of all features per cluster while streaming a CSV file in chunks,
+        i.e., memory usage depends on the number of distinct values and not on the number of rows.
+
+        :param filepath_or_buffer: Path or buffer of the CSV file
+        :param None or array-like labels: Clustering labels (one per row of the file). If None, the
+            labels are read from the cluster column of the file.
+        :param None or list of str columns: Features to count. If None, all columns except the
+            cluster column are used.
+        :param str cluster_column: Name of the column with the clustering labels
+        :param int chunksize: Number of rows per chunk
+        :param None or Binning binning: Fitted binning to discretize continuous features (counted per bin,
+            values are the bin intervals as in Binning.transform)
+        :param kwargs: Keyword arguments to pass to pd.read_csv (e.g., dtype to fix the types of the columns,
+            otherwise a column parsed as numbers in some chunks and as strings in others is counted by the
+            string form of its values, see __add__, where floats may be formatted differently than in the file)
+        :return: Contingency tables of the entire dataset
+        :rtype: ClusterValueCounts
+        """
+        if columns is not None:
+            kwargs['usecols'] = list(columns) + ([cluster_column] if labels is None else [])
+        kwargs.setdefault('low_memory', False)     # a single type per column and chunk
+        bounds = {}
+        dtypes = {}
+
+        def _labeled_chunks():
+            nonlocal bounds
+            offset = 0
+            with pd.read_csv(filepath_or_buffer, chunksize=chunksize, **kwargs) as reader:
+                for chunk in reader:
+                    if labels is not None:
+                        chunk[cluster_column] = np.asarray(labels[offset:offset + len(chunk)])
+                    offset += len(chunk)
+                    if binning is not None:
+                        dtypes.update(chunk.dtypes.to_dict())
+                        chunk, chunk_bounds = binning.bin_index(chunk)
+                        bounds = binning.merge_bounds(bounds, chunk_bounds)
+                    yield chunk
+            if labels is not None and offset != len(labels):
+                raise ValueError(f"Number of labels ({len(labels)}) does not match number of rows ({offset})")
+
+        res = cls.from_chunks(_labeled_chunks(), columns=columns, cluster_column=cluster_column)
+
+        # Label the counted bin numbers with the intervals of the values observed over all chunks
+        for col in bounds:
+            if col in res.columns:
+                j = res.columns.index(col)
+                res.values[j] = binning.intervals(col, bounds, dtype=dtypes[col])[res.values[j].astype(int)]
+        return res
+
+    def __add__(self, other):
+        """Add the counts of two (disjoint) parts of a dataset. If the values of a feature have
+        different types in both parts and not both are numeric (e.g., numbers and strings of a CSV
+        column parsed in chunks), the values are merged by their string form.
+
+        :param ClusterValueCounts other: Contingency tables of the other part
+        :return: Contingency tables of both parts
+        :rtype: ClusterValueCounts
+        """
+        if self.columns != other.columns:
+            raise ValueError(f"Cannot add counts of different features {self.columns} and {other.columns}")
+        num_clusters = max(self.num_clusters, other.num_clusters)
+
+        values, counts, totals = [], [], []
+        for j, col in enumerate(self.columns):
+            # Union of the values of both parts (sorted) and the positions of each part's values in it
+            v1, v2 = _common_values(self.values[j], other.values[j])
+            parts = [pd.Series(v) for v in (v1, v2) if len(v) > 0]   # skip empty parts to keep the dtype
+            codes, union = pd.factorize(pd.concat(parts, ignore_index=True), sort=True) if parts \
+                else (np.zeros(0, dtype=np.int64), v1)
+            c1, c2 = codes[:len(v1)], codes[len(v1):]
+
+            col_counts = np.zeros((num_clusters, len(union)), dtype=np.int64)
+            col_counts[:self.num_clusters, c1] += self.column_counts(col)
+            col_counts[:other.num_clusters, c2] += other.column_counts(col)
+            col_totals = np.zeros(len(union), dtype=np.int64)
+            col_totals[c1] += self.totals[self.column_slice(col)]
+            col_totals[c2] += other.totals[other.column_slice(col)]
+
+            values.append(np.asarray(union))
+            counts.append(col_counts)
+            totals.append(col_totals)
+
+        sizes = np.zeros(num_clusters, dtype=np.int64)
+        sizes[:self.num_clusters] += self.sizes
+        sizes[:other.num_clusters] += other.sizes
+
+        res = ClusterValueCounts(self.columns, values, None, None, sizes, self.n + other.n)
+        res.counts = np.concatenate(counts, axis=1) if counts else np.zeros((num_clusters, 0), dtype=np.int64)
+        res.totals = np.concatenate(totals) if totals else np.zeros(0, dtype=np.int64)
+        return res
+
+    @property
+    def num_clusters(self):
+        return self.counts.shape[0]
+
+    def column_slice(self, col):
+        """Matrix columns of the values of a feature.
+
+        :param str col: Feature name
+        :return: Slice of the count matrix columns
+        :rtype: slice
+        """
+        j = self.columns.index(col)
+        return slice(self.offsets[j], self.offsets[j + 1])
+
+    def column_counts(self, col):
+        """Value counts per cluster of a single feature.
+
+        :param str col: Feature name
+        :return: Count matrix of shape (num_clusters, num_values of col)
+        :rtype: np.ndarray
+        """
+        return self.counts[:, self.column_slice(col)]
+
+    def missing_counts(self):
+        """Number of missing values (NaN) of each feature per cluster.
+
+        :return: Count matrix of shape (num_clusters, num_features)
+        :rtype: np.ndarray
+        """
+        return self.sizes[:, np.newaxis] - self.column_sums(self.counts)
+
+    def missing_totals(self):
+        """Number of missing values (NaN) of each feature over all rows (incl. outliers).
+
+        :return: Counts of shape (num_features,)
+        :rtype: np.ndarray
+        """
+        return self.n - self.column_sums(self.totals)
+
+    def column_sums(self, x):
+        """Sum the entries of x over the values of each feature.
+
+        :param np.ndarray x: Array with the values along the last axis, shape = (..., num_values)
+        :return: Sums per feature, shape = (..., num_features)
+        :rtype: np.ndarray
+        """
+        # Pad with a zero entry, so that reduceat works for features without any values
+        pad = np.zeros(x.shape[:-1] + (1,), dtype=x.dtype)
+        sums = np.add.reduceat(np.concatenate((x, pad), axis=-1), self.offsets[:-1], axis=-1)
+        sums[..., np.diff(self.offsets) == 0] = 0
+        return sums
+
+
+def _common_values(v1, v2):
+    """Cast the values of a feature in two parts of a dataset to a common type, i.e., to strings
+    if their types differ and are not both numeric (values of different types cannot be sorted).
+
+    :param np.ndarray v1: Sorted distinct values in the first part
+    :param np.ndarray v2: Sorted distinct values in the second part
+    :return: Values of both parts (sorted order is not maintained by the cast)
+    :rtype: (np.ndarray, np.ndarray)
+    """
+    if len(v1) == 0 or len(v2) == 0 or v1.dtype == v2.dtype \
+            or (np.issubdtype(v1.dtype, np.number) and np.issubdtype(v2.dtype, np.number)):
+        return v1, v2
+    return tuple(pd.Series(v, dtype=object).astype(str).to_numpy(dtype=object) for v in (v1, v2))
@@ -6,127 +6,149 @@ from ipywidgets import interact
 from matplotlib.collections import LineCollection
 from matplotlib.patches import Patch
 from subgroup_detection import util
+from subgroup_detection.contingency import ClusterValueCounts
+
+
+def _as_counts(data, columns=None):
+    """
+    Get the cluster x value contingency tables of the given dataset.
+    @param data: Dataset with one additional column 'cluster' containing the clustering labels or its
+    already computed contingency tables.
+    @type data: pd.DataFrame or ClusterValueCounts
+    @param columns: Features to count. If None, all columns except 'cluster' are used.
+    @type columns: None or list of str
+    @return: Contingency tables of the clustered dataset
+    @rtype: ClusterValueCounts
+    """
+    if isinstance(data, ClusterValueCounts):
+        return data
+    return ClusterValueCounts.from_data(data, columns=columns)
+
+
+def _plogp(counts, sizes):
+    """
+    Compute the entropy terms Px * log(Px) for the relative value frequencies Px = counts / sizes.
+    @param counts: Value counts (zero counts yield zero terms)
+    @type counts: np.ndarray
+    @param sizes: Number of rows the counts refer to (broadcastable to counts)
+    @type sizes: np.ndarray or int
+    @return: Entropy terms
+    @rtype: np.ndarray
+    """
+    present = counts > 0
+    Px = np.divide(counts, sizes, out=np.zeros(counts.shape), where=present)
+    return Px * np.log(Px, out=np.zeros(counts.shape), where=present)
+
+
+def _cluster_entropy(counts):
+    """
+    Compute the (not normalized) feature entropy H = - sum[Px * log(Px)] for each cluster
+    (missing values are a value of their own).
+    @param counts: Contingency tables of the clustered dataset
+    @type counts: ClusterValueCounts
+    @return: Feature entropy per cluster, shape = (num_clusters, num_features)
+    @rtype: np.ndarray
+    """
+    sizes = counts.sizes[:, np.newaxis]
+    return - counts.column_sums(_plogp(counts.counts, sizes)) - _plogp(counts.missing_counts(), sizes)
 
 
 def normalized_entropy(data):
     """
     Compute the normalized feature entropy for each cluster.
-    @param data: Dataset with one additional column 'cluster' containing the clustering labels.
-    @type data: pd.DataFrame
+    @param data: Dataset with one additional column 'cluster' containing the clustering labels
+    (or its contingency tables).
+    @type data: pd.DataFrame or ClusterValueCounts
     @return: Normalized feature entropy per cluster
     @rtype: pd.DataFrame
     """
-    # Create output dataframe with same columns as x and one row per cluster
-    num_clusters = data['cluster'].max() + 1
-    clus_size = data.groupby('cluster').size()
-    clusdf = pd.DataFrame(0, index=np.arange(num_clusters), columns=data.columns.drop('cluster'))
-
-    # Iterate over all features
-    for fn in clusdf.columns:
-        grouped = data.groupby(['cluster', fn])
-
-        # Compute entropy H = - sum[Px * log(Px)]
-        Px = grouped.size() / clus_size  # value frequency
-        entropy = - (Px * np.log(Px))
-        H = entropy.groupby('cluster', sort=True).sum()
+    counts = _as_counts(data)
+    H = _cluster_entropy(counts)
 
-        # normalize by H_max = log(N)
-        N = data[fn].nunique()
-        H_max = np.log(N)
-        clusdf[fn] = H / H_max
+    # normalize by H_max = log(N) with N = number of values in the entire dataset (incl. missing)
+    N = counts.column_sums((counts.totals > 0).astype(np.int64)) + (counts.missing_totals() > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        NE = H / np.log(N)
+    NE[counts.column_sums(counts.counts) == 0] = np.nan    # no values (empty cluster or only NaN)
 
-    return clusdf
+    return pd.DataFrame(NE, index=np.arange(counts.num_clusters), columns=counts.columns)
 
 
 def normalized_entropy_cluster(data):
     """
     Compute the normalized feature entropy for each cluster (normalize feature entropy
     for values present in cluster, NOT entire dataset).
-    @param data: Dataset with one additional column 'cluster' containing the clustering labels.
-    @type data: pd.DataFrame
+    @param data: Dataset with one additional column 'cluster' containing the clustering labels
+    (or its contingency tables).
+    @type data: pd.DataFrame or ClusterValueCounts
     @return: Normalized feature entropy per cluster
     @rtype: pd.DataFrame
     """
-    # Create output dataframe with same columns as x and one row per cluster
-    num_clusters = data['cluster'].max() + 1
-    clus_size = data.groupby('cluster').size()
-    clusdf = pd.DataFrame(0, index=np.arange(num_clusters), columns=data.columns.drop('cluster'))
-
-    # Iterate over all features
-    for fn in clusdf.columns:
-        grouped = data.groupby(['cluster', fn])
+    counts = _as_counts(data)
+    H = _cluster_entropy(counts)
 
-        # Compute entropy H = - sum[Px * log(Px)]
-        Px = grouped.size() / clus_size  # relative value frequency
-        entropy = - (Px * np.log(Px))
-        H = entropy.groupby('cluster', sort=True).sum()
-        # print(H)
+    # normalize by H_max = log(N) with N = number of values present in the cluster (incl. missing)
+    N = counts.column_sums((counts.counts > 0).astype(np.int64)) + (counts.missing_counts() > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        NE = H / np.log(N)
+    NE[N <= 1] = 0      # div by 0 (from log(1))
+    NE[counts.column_sums(counts.counts) == 0] = np.nan    # no values (empty cluster or only NaN)
 
-        # normalize by H_max = log(N)
-        N = data[['cluster', fn]].groupby('cluster').nunique()
-        H_max = np.log(N.values)
-        clusdf[fn] = H.div(H_max.T[0], axis=0).fillna(0)   # div by 0 (from log(1)) causes NaN values
-
-    return clusdf
+    return pd.DataFrame(NE, index=np.arange(counts.num_clusters), columns=counts.columns)
 
 
 def relative_entropy(data):
     """
     Compute the relative feature entropy for each cluster.
-    @param data: Dataset with one additional column 'cluster' containing the clustering labels.
-    @type data: pd.DataFrame
+    @param data: Dataset with one additional column 'cluster' containing the clustering labels
+    (or its contingency tables).
+    @type data: pd.DataFrame or ClusterValueCounts
     @return: Relative feature entropy per cluster
     @rtype: pd.DataFrame
     """
-    # Create output dataframe with same columns as x and one row per cluster
-    num_clusters = data['cluster'].max() + 1
-    clus_size = data.groupby('cluster').size()
-    clusdf = pd.DataFrame(0, index=np.arange(num_clusters), columns=data.columns.drop('cluster'))
+    counts = _as_counts(data)
 
-    # Compute global frequencies Qx per feature
-    data_size = len(data)
-    Qx = {fn: data.groupby(fn).size() / data_size for fn in clusdf.columns}
+    # Relative value frequencies Px per cluster and global frequencies Qx (incl. outliers), missing values
+    # are appended as a value of their own per feature. Values present in a cluster are present in the
+    # entire dataset, thus Qx > 0 wherever Px > 0.
+    cluster_counts = np.concatenate((counts.counts, counts.missing_counts()), axis=1)
+    total_counts = np.concatenate((counts.totals, counts.missing_totals()))
+    present = cluster_counts > 0
+    Px = np.divide(cluster_counts, counts.sizes[:, np.newaxis], out=np.zeros(cluster_counts.shape), where=present)
+    Qx = np.broadcast_to(total_counts / counts.n, Px.shape)
 
-    # Compute relative entropy=sum[Px * log(Px / Qx)] (Kullback-Leibler divergence)
-    for fn in clusdf.columns:
-        grouped = data.groupby(['cluster', fn])
-        Px = grouped.size() / clus_size
+    # Compute relative entropy=sum[Px * log(Px / Qx)] (Kullback-Leibler divergence), values with Px=0 add nothing
+    ratio = np.divide(Px, Qx, out=np.ones(Px.shape), where=present)
+    terms = Px * np.log(ratio)
+    RE = counts.column_sums(terms[:, :counts.offsets[-1]]) + terms[:, counts.offsets[-1]:]
+    RE[counts.column_sums(counts.counts) == 0] = np.nan    # no values (empty cluster or only NaN)
 
-        # Iterate over clusters
-        relative_entropies = np.zeros(num_clusters)
-        for i in range(num_clusters):
-            entropy = Px[i] * np.log(Px[i] / Qx[fn])
-            relative_entropies[i] = entropy.sum()
-        clusdf[fn] = relative_entropies
-
-    return clusdf
+    return pd.DataFrame(RE, index=np.arange(counts.num_clusters), columns=counts.columns)
 
 
 def baseline_entropy(data, normalize=False):
     """
     Compute the feature entropy of the baseline (unclustered, entire dataset).
-    @param data: Baseline dataset
-    @type data: pd.DataFrame
+    @param data: Baseline dataset (or its contingency tables)
+    @type data: pd.DataFrame or ClusterValueCounts
     @param normalize: If true, normalize the entropy values by the maximum possible entropy H_max = np.log(num_values)
     @type normalize: bool
     @return: Baseline entropy values for each feature
     @rtype: pd.DataFrame
     """
+    if isinstance(data, ClusterValueCounts):
+        counts = data
+    else:
+        counts = ClusterValueCounts.from_data(data, columns=data.columns.drop(['out', 'class', 'cluster']))
 
-    # Result dataframe (1 row)
-    base_entr = pd.DataFrame(0, index=np.arange(1), columns=data.columns.drop(['out', 'class', 'cluster']))
-
-    # Iterate over features (columns)
-    for fn in base_entr.columns:
-        grouped = data.groupby(fn)
-        Px = grouped.size() / len(data)
-
-        # Compute entropy and optionally normalize it
-        base_entr[fn] = - (Px * np.log(Px)).sum()
-        if normalize:
-            base_entr[fn] = base_entr[fn] / grouped.ngroups
-    return base_entr
+    # Compute entropy (missing values are a value of their own) and optionally normalize it
+    missing = counts.missing_totals()
+    H = - counts.column_sums(_plogp(counts.totals, counts.n)) - _plogp(missing, counts.n)
+    if normalize:
+        H = H / (counts.column_sums((counts.totals > 0).astype(np.int64)) + (missing > 0))
 
+    # Result dataframe (1 row)
+    return pd.DataFrame([H], index=np.arange(1), columns=counts.columns)
 
 
 def select_cluster_entropy(entropy, c, threshold=None):
@@ -146,39 +168,44 @@ def select_cluster_entropy(entropy, c, threshold=None):
 
     # If threshold is set, remove features with entropy >= threshold
     if threshold is not None:
-        e = e.applymap(lambda z: z if z < threshold else np.nan)
-        e = e.dropna(axis='columns')
+        e = e.where(e < threshold).dropna(axis='columns')
     return e
 
 
 def compute_cluster_groups_rate(data, clustering, entropy, baseline, threshold=0.5, max_rate=0.75):
+    """
+    Detect the subgroups indicated by the clustering of data. Search for dominant features using the
+    feature entropy per cluster and its rate compared to the baseline entropy.
+    @param data: Dataset (without clustering labels)
+    @type data: pd.DataFrame
+    @param clustering: Clustering labels
+    @type clustering: list of int
+    @param entropy: Feature entropy per cluster (one row per cluster, features are columns)
+    @type entropy: pd.DataFrame
+    @param baseline: Feature entropy of the entire dataset (one row)
+    @type baseline: pd.DataFrame
+    @param threshold: Maximal entropy value
+    @type threshold: float
+    @param max_rate: Maximal rate of cluster entropy and baseline entropy
+    @type max_rate: float
+    @return: Detected subgroups
+    @rtype: pd.DataFrame
+    """
     rate = entropy.div(baseline.iloc[0], axis='columns')
     data['cluster'] = clustering
 
-    # Iterate over groupby cluster column
-    groups = []
-    for c, cluster in data.groupby('cluster'):
-
-        # Cluster feature entropy
-        e = select_cluster_entropy(entropy, c, threshold)
-        e = e.mask(rate >= max_rate).dropna(axis=1)
-
-        # Iterate over columns (that were not dropped)
-        group = {}
-        for i, col in enumerate(e.columns):
-            counts = cluster.value_counts(subset=col, normalize=True, sort=False)
-            group[col] = counts.idxmax()
-
-        groups = groups + [group]
-    return pd.DataFrame(groups)
+    # Select features with entropy < threshold and rate < max_rate
+    with np.errstate(invalid='ignore'):
+        mask = (entropy.to_numpy(dtype=float) < threshold) & ~(rate.to_numpy(dtype=float) >= max_rate)
+    return _cluster_groups(_as_counts(data, columns=entropy.columns), entropy.columns.tolist(), mask)
 
 
 def cluster_groups(data, entropy, threshold=0.65):
     """
     Detect the subgroups indicated by the clustering of data.
     Search for dominant features using the feature entropy per cluster.
-    @param data: Data with clustering labels (column 'cluster')
-    @type data: pd.DataFrame
+    @param data: Data with clustering labels (column 'cluster') or its contingency tables
+    @type data: pd.DataFrame or ClusterValueCounts
     @param entropy: Feature entropy per cluster (one row per cluster, features are columns)
     @type entropy: pd.DataFrame
     @param threshold: Maximal entropy value
@@ -186,39 +213,136 @@ def cluster_groups(data, entropy, threshold=0.65):
     @return: Detected subgroups
     @rtype: pd.DataFrame
     """
-    # Iterate over groupby cluster column
-    groups = []
-    for c, cluster in data.groupby('cluster'):
-
-        if c < 0:
-            continue
-
-        # Select entropy for cluster c
-        e = select_cluster_entropy(entropy, c, threshold)
-
-        # Iterate over columns
-        group = {}
-        for i, col in enumerate(e.columns):
-            counts = cluster.value_counts(subset=col, normalize=True, sort=False)
-            group[col] = counts.idxmax()
-        groups = groups + [group]
-
-    return pd.DataFrame(groups)
+    with np.errstate(invalid='ignore'):
+        mask = entropy.to_numpy(dtype=float) < threshold
+    return _cluster_groups(_as_counts(data, columns=entropy.columns), entropy.columns.tolist(), mask)
 
 
 def normalized_entropy_groups(data, threshold=0.65):
     """
     Detect subgroups for the clustered data by using the normalized entropy.
-    @param data: Clustered data (column 'cluster' contains cluster labels)
-    @type data: pd.DataFrame
+    @param data: Clustered data (column 'cluster' contains cluster labels) or its contingency tables
+    @type data: pd.DataFrame or ClusterValueCounts
     @param threshold: Maximum entropy
     @type threshold: float
     @return: Detected subgroups from clusters
     @rtype: pd.DataFrame
     """
-    # NE = normalized_entropy(data)
-    NE = normalized_entropy_cluster(data)
-    return cluster_groups(data, NE, threshold)
+    counts = _as_counts(data)
+    # NE = normalized_entropy(counts)
+    NE = normalized_entropy_cluster(counts)
+    return cluster_groups(counts, NE, threshold)
+
+
+def _cluster_groups(counts, columns, mask):
+    """
+    Build the subgroups of all (non-empty) clusters from the selected features, i.e., the most
+    frequent value of each selected feature in the cluster.
+    @param counts: Contingency tables of the clustered dataset
+    @type counts: ClusterValueCounts
+    @param columns: Feature names
+    @type columns: list of str
+    @param mask: Selected features per cluster, shape = (num_clusters, num_features)
+    @type mask: np.ndarray
+    @return: Detected subgroups (one row per non-empty cluster)
+    @rtype: pd.DataFrame
+    """
+    # Skip outliers and empty clusters
+    clusters = np.flatnonzero(counts.sizes > 0)
+    modes = [m[clusters] for m in _modal_values(counts, columns)]
+    return _groups_from_mask(columns, modes, mask[clusters])
+
+
+def _modal_values(counts, columns):
+    """
+    Get the most frequent value of each cluster for the given features (argmax over the value counts,
+    ties are resolved in favor of the smallest value).
+    @param counts: Contingency tables of the clustered dataset
+    @type counts: ClusterValueCounts
+    @param columns: Feature names
+    @type columns: list of str
+    @return: Modal values per feature, each of length num_clusters
+    @rtype: list of np.ndarray
+    """
+    modes = []
+    for col in columns:
+        col_counts = counts.column_counts(col)
+        if col_counts.shape[1] == 0:
+            modes.append(np.full(counts.num_clusters, np.nan, dtype=object))   # no values at all (only NaN)
+        else:
+            modes.append(counts.values[counts.columns.index(col)][np.argmax(col_counts, axis=1)])
+    return modes
+
+
+def _groups_from_mask(columns, modes, mask):
+    """
+    Build the subgroups from the selected features of each cluster.
+    @param columns: Feature names
+    @type columns: list of str
+    @param modes: Modal values per feature (one entry per row of the mask)
+    @type modes: list of np.ndarray
+    @param mask: Selected features per cluster, shape = (num_clusters, num_features)
+    @type mask: np.ndarray
+    @return: Subgroups (one row per cluster)
+    @rtype: pd.DataFrame
+    """
+    groups = [{columns[j]: modes[j][i] for j in np.flatnonzero(row)} for i, row in enumerate(mask)]
+    return pd.DataFrame(groups)
+
+
+def cluster_groups_sweep(data, entropy, thresholds=None):
+    """
+    Detect the subgroups indicated by the clustering of data for several entropy thresholds at once.
+    The entropy and the modal values are computed once; the features selected for a threshold are
+    derived from the sorted entropy values.
+    @param data: Data with clustering labels (column 'cluster') or its contingency tables
+    @type data: pd.DataFrame or ClusterValueCounts
+    @param entropy: Feature entropy per cluster (one row per cluster, features are columns)
+    @type entropy: pd.DataFrame
+    @param thresholds: Maximal entropy values. If None, use every distinct breakpoint, i.e., each distinct
+    entropy value and infinity (all features selected).
+    @type thresholds: None or list of float
+    @return: Detected subgroups per threshold (same result as cluster_groups for each threshold)
+    @rtype: dict of (float, pd.DataFrame)
+    """
+    counts = _as_counts(data, columns=entropy.columns)
+    columns = entropy.columns.tolist()
+
+    # Skip outliers and empty clusters
+    clusters = np.flatnonzero(counts.sizes > 0)
+    E = entropy.to_numpy(dtype=float)[clusters]
+    modes = [m[clusters] for m in _modal_values(counts, columns)]
+
+    # Sort all (finite) entropy values once
+    cells = np.flatnonzero(~np.isnan(E))
+    order = np.argsort(E.flat[cells], kind='stable')
+    cells, sorted_entropy = cells[order], E.flat[cells[order]]
+
+    if thresholds is None:
+        thresholds = np.append(np.unique(sorted_entropy), np.inf)
+
+    # Features with entropy < threshold are a prefix of the sorted entropy values
+    groups = {}
+    for t in thresholds:
+        mask = np.zeros(E.shape, dtype=bool)
+        mask.flat[cells[:np.searchsorted(sorted_entropy, t, side='left')]] = True
+        groups[t] = _groups_from_mask(columns, modes, mask)
+    return groups
+
+
+def normalized_entropy_groups_sweep(data, thresholds=None):
+    """
+    Detect subgroups for the clustered data by using the normalized entropy for several thresholds at once.
+    @param data: Clustered data (column 'cluster' contains cluster labels) or its contingency tables
+    @type data: pd.DataFrame or ClusterValueCounts
+    @param thresholds: Maximum entropy values. If None, use every distinct breakpoint.
+    @type thresholds: None or list of float
+    @return: Detected subgroups from clusters per threshold
+    @rtype: dict of (float, pd.DataFrame)
+    """
+    counts = _as_counts(data)
+    NE = normalized_entropy_cluster(counts)
+    return cluster_groups_sweep(counts, NE, thresholds)
 
 
 
@@ -1,15 +1,23 @@
 import json
+import multiprocessing
+import os
+import tempfile
+import time
 import warnings
 from typing import Callable
 
 import pandas as pd
+import pyarrow as pa
 from aif360.sklearn import metrics as mtr
-from aif360.sklearn.utils import check_groups
 from pandas import DataFrame, Series
 from sklearn.base import ClusterMixin
 from sklearn.exceptions import UndefinedMetricWarning
 from sklearn.metrics import accuracy_score, f1_score
+from threadpoolctl import threadpool_limits
 
+from subgroup_detection import metrics as mtc
+from subgroup_detection.binning import Binning
+from subgroup_detection.bitmap import BitmapIndex
 from subgroup_detection.clustering import *
 from subgroup_detection.entropy import *
 from subgroup_detection.util import *
@@ -63,7 +71,7 @@ def priveleged_group(data, protected, prot_vals):
     return tuple(priv_group)
 
 
-def cluster_fairness(data, cluster_labels, groups, pos_label):
+def cluster_fairness(data, cluster_labels, groups, pos_label, n_bootstrap=None, confidence=0.95, random_state=None):
     """
     Compute different fairness metrics for the given clustering and subgroups.
     @param data: Dataset of n instances incl. columns 'out' (predicted class) and 'class' (groundtruth class).
@@ -74,15 +82,21 @@ def cluster_fairness(data, cluster_labels, groups, pos_label):
     @type groups: DataFrame
     @param pos_label: Value of the predicted/true classification label (0 or 1)
     @type pos_label: int
-    @return: General fairness, subgroup fairness, protected groups and group sizes (entropy)
-    @rtype: (DataFrame, DataFrame, dict of dict, dict)
+    @param n_bootstrap: Number of bootstrap replicates for confidence intervals of the subgroup fairness or None
+    @type n_bootstrap: None or int
+    @param confidence: Confidence level of the bootstrap intervals
+    @type confidence: float
+    @param random_state: Seed of the bootstrap
+    @type random_state: None or int
+    @return: General fairness, subgroup fairness, protected groups and group sizes (entropy), and if n_bootstrap
+    is given, the confidence intervals of the subgroup fairness (columns <metric>_low and <metric>_high)
+    @rtype: (DataFrame, DataFrame, dict of dict, dict) or (DataFrame, DataFrame, dict of dict, dict, DataFrame)
     """
     # Ground truth for clusters
     protected = ['cluster']
     data['cluster'] = cluster_labels
     y_pred = data['out']
     gt = ground_truth_protected(data, protected)
-    grouped = data.groupby('cluster')
 
     # Compute general metrics
     base_rate = [mtr.base_rate(gt, y_pred, pos_label=0), mtr.base_rate(gt, y_pred)]
@@ -103,98 +117,183 @@ def cluster_fairness(data, cluster_labels, groups, pos_label):
     num_cluster = max(cluster_labels) + 1
     priv_groups = {}
     group_sizes = []
-    is_duplicated = groups.duplicated()  # to skip duplicate subgroups
     subgroup_fairness = DataFrame(0, index=list(range(num_cluster)),
                                   columns=[  # 'priv_group',
                                       'c_stat_par', 'c_eq_opp', 'c_avg_odds', 'c_acc',
                                       'g_stat_par', 'g_eq_opp', 'g_avg_odds', 'g_acc', ])
 
-    for i, cluster in grouped:
-
-        # Skip outliers
-        if i < 0:
-            continue
-
-        # Privileged group for cluster
-        pg = priveleged_group(data, protected, [i])
-
-        # Compute cluster fairness
-        cluster_stat_par, cluster_eq_opp, cluster_avg_odds, cluster_acc = \
-            _subgroup_fairness(gt, y_pred, protected, pg, pos_label, cluster['class'], cluster['out'])
+    # Confusion counts of all clusters in a single pass
+    y_true = data['class'].to_numpy(dtype=int)
+    y_out = y_pred.to_numpy(dtype=int)
+    total_counts = confusion_counts(np.zeros(len(data), dtype=int), y_true, y_out, 1)[0]
+    cluster_counts = confusion_counts(np.asarray(cluster_labels), y_true, y_out, num_cluster)
+    clusters = np.flatnonzero(cluster_counts.sum(axis=(1, 2)) > 0)     # skip outliers and empty clusters
+
+    # Compute cluster fairness (each cluster vs. rest)
+    cluster_metrics = subgroup_fairness_metrics(cluster_counts[clusters], total_counts - cluster_counts[clusters],
+                                                pos_label)
+
+    # Confusion counts of the groups (duplicate groups share their counts)
+    index = BitmapIndex(data)
+    true_bits = index.pack(y_true == 1)
+    pred_bits = index.pack(y_out == 1)
+    group_counts = np.zeros((num_cluster, 2, 2), dtype=np.int64)
+    has_group = np.zeros(num_cluster, dtype=bool)
+    computed = {}
+    for i in clusters:
 
         # Group fairness
         group = groups.iloc[i].dropna()
         priv_groups[i] = group.to_dict()
 
-        # Skip empty or duplicate groups
-        if group.empty or is_duplicated[i]:
-            group_stat_par = group_eq_opp = group_avg_odds = group_acc = np.NaN
+        # Skip empty groups
+        if group.empty:
             group_sizes.append(None)    # store size of group i
         else:
-            group_protected = group.index.tolist()
-
-            # ground truth of all (protected attributes from group)
-            gt_group_prot = ground_truth_protected(data, group_protected)
-            group_pg = priveleged_group(data, group_protected, group.values.tolist())
+            key = tuple(priv_groups[i].items())
+            if key not in computed:
+                bits = index.pattern(priv_groups[i])  # data in group only (subset of whole dataset)
+                computed[key] = index.confusion_counts(bits, true_bits, pred_bits)
+            group_counts[i] = computed[key]
+            has_group[i] = True
 
-            test, _ = check_groups(gt_group_prot, group_protected)
-            idx = (test == group_pg)
-            group_gt = gt_group_prot[idx]  # ground truth for data in group only (subset of whole dataset)
-            group_out = y_pred[idx]
+            group_sizes.append(int(group_counts[i].sum()))       # store size of group i
 
-            group_sizes.append(len(group_gt))       # store size of group i
+    # Compute group fairness (each group vs. rest)
+    group_metrics = np.full((4, len(clusters)), np.nan)
+    group_metrics[:, has_group[clusters]] = subgroup_fairness_metrics(group_counts[has_group],
+                                                                      total_counts - group_counts[has_group],
+                                                                      pos_label)
 
-            # Compute group fairness
-            group_stat_par, group_eq_opp, group_avg_odds, group_acc = \
-                _subgroup_fairness(gt_group_prot, y_pred, group_protected, group_pg, pos_label, group_gt, group_out)
-
-        # Store metrics
-        subgroup_fairness.iloc[i] = [cluster_stat_par, cluster_eq_opp, cluster_avg_odds, cluster_acc,
-                                     group_stat_par, group_eq_opp, group_avg_odds, group_acc]
+    # Store metrics
+    subgroup_fairness.iloc[clusters] = np.column_stack(cluster_metrics + tuple(group_metrics))
 
     # Remove column 'cluster' from dataset
     data.drop(columns='cluster', inplace=True)
 
-    return general_fairness, subgroup_fairness, priv_groups, group_sizes
+    if n_bootstrap is None:
+        return general_fairness, subgroup_fairness, priv_groups, group_sizes
+
+    # Bootstrap confidence intervals of clusters and groups
+    rng = np.random.default_rng(random_state)
+    counts = np.concatenate((cluster_counts[clusters], group_counts[has_group]))
+    bounds = _bootstrap_fairness(counts, total_counts - counts, pos_label, n_bootstrap, confidence, rng)
+    ci_bounds = np.full((2, 8, len(clusters)), np.nan)
+    ci_bounds[:, :4] = bounds[:, :, :len(clusters)]
+    ci_bounds[:, 4:, has_group[clusters]] = bounds[:, :, len(clusters):]
+
+    ci = DataFrame(np.nan, index=subgroup_fairness.index,
+                   columns=[f'{col}_{b}' for col in subgroup_fairness.columns for b in ('low', 'high')])
+    ci.iloc[clusters, 0::2] = ci_bounds[0].T
+    ci.iloc[clusters, 1::2] = ci_bounds[1].T
+
+    return general_fairness, subgroup_fairness, priv_groups, group_sizes, ci
 
 
-def _subgroup_fairness(y_true, y_pred, protected, pg, pos_label, group_true, group_pred):
+def confusion_counts(labels, y_true, y_pred, num_groups):
     """
-    Compute different subgroup fairness metrics.
-    @param y_true: Ground-truth data in a dataframe indexed by the protected attributes
-    @type y_true: DataFrame
-    @param y_pred: Predicted labels of whole dataset
-    @type y_pred: list of int
-    @param protected: Protected attribute names
-    @type protected: list of str
-    @param pg: Protected subgroup definition (attribute values for protected attributes)
-    @type pg: list of obj
+    Count the instances per group, ground-truth class and predicted class in a single pass.
+    @param labels: Group (cluster) of each instance, instances with negative labels (outliers) are not counted
+    @type labels: np.ndarray
+    @param y_true: Ground-truth labels (0 or 1)
+    @type y_true: np.ndarray
+    @param y_pred: Predicted labels (0 or 1)
+    @type y_pred: np.ndarray
+    @param num_groups: Number of groups
+    @type num_groups: int
+    @return: Count tensor of shape (num_groups, 2, 2) indexed by (group, class, out)
+    @rtype: np.ndarray
+    """
+    valid = labels >= 0
+    flat = labels[valid] * 4 + y_true[valid] * 2 + y_pred[valid]
+    return np.bincount(flat, minlength=num_groups * 4).reshape(num_groups, 2, 2)
+
+
+def confusion_matrices(group_counts, rest_counts, pos_label):
+    """
+    Get the confusion matrices of the privileged (group) and unprivileged (rest) subgroups
+    from the confusion counts (same order as metrics.conf_matrix).
+    @param group_counts: Count tensor of the groups, shape = (..., 2, 2)
+    @type group_counts: np.ndarray
+    @param rest_counts: Count tensor of the rest of the dataset for each group, shape = (..., 2, 2)
+    @type rest_counts: np.ndarray
     @param pos_label: Positive (favorable) label (0 or 1)
     @type pos_label: int
-    @param group_true: Ground-truth labels for the protected group
-    @type group_true: list of int
-    @param group_pred: Predicted labels for the protected group
-    @type group_pred: list of int
-    @return: Subgroup fairness for metrics statistical parity, equal opportunity,
-    equalized odds and subgroup accuracy.
-    @rtype: (float, float, float, float)
+    @return: tn, fp, fn, tp, tn2, fp2, fn2, tp2 (arrays with one entry per group)
+    @rtype: (np.ndarray, ...)
     """
-    stat_par = mtr.statistical_parity_difference(y_true, y_pred, prot_attr=protected,
-                                                 priv_group=pg, pos_label=pos_label)
+    neg = 1 - pos_label
+    return tuple(c[..., t, o] for c in (group_counts, rest_counts)
+                 for t, o in ((neg, neg), (neg, pos_label), (pos_label, neg), (pos_label, pos_label)))
 
-    eq_opp = mtr.equal_opportunity_difference(y_true, y_pred, prot_attr=protected,
-                                              priv_group=pg, pos_label=pos_label)
 
-    avg_odds = mtr.average_odds_difference(y_true, y_pred, prot_attr=protected,
-                                           priv_group=pg, pos_label=pos_label)
+def _false_positive_rate(tn, fp):
+    """
+    False positive rate fp / (fp + tn) of groups, which is 1 for groups without negatives
+    (1 - specificity with zero division set to 0, as computed by aif360).
+    @param tn: True negatives
+    @type tn: np.ndarray
+    @param fp: False positives
+    @type fp: np.ndarray
+    @return: False positive rates
+    @rtype: np.ndarray
+    """
+    return 1 - np.divide(tn, tn + fp, out=np.zeros(np.shape(tn)), where=(tn + fp) > 0)
 
-    # disp_imp = mtr.disparate_impact_ratio(gt, y_pred, prot_attr=protected,
-    #                                               priv_group=pg, pos_label=pos_label)
-    acc = accuracy_score(group_true, group_pred)
 
+def subgroup_fairness_metrics(group_counts, rest_counts, pos_label):
+    """
+    Compute different subgroup fairness metrics for multiple groups at once (each group vs. rest).
+    @param group_counts: Count tensor of the groups, shape = (..., 2, 2) (see confusion_counts)
+    @type group_counts: np.ndarray
+    @param rest_counts: Count tensor of the rest of the dataset for each group, shape = (..., 2, 2)
+    @type rest_counts: np.ndarray
+    @param pos_label: Positive (favorable) label (0 or 1)
+    @type pos_label: int
+    @return: Subgroup fairness for metrics statistical parity, equal opportunity,
+    equalized odds and subgroup accuracy (arrays with one entry per group).
+    @rtype: (np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+    """
+    C = confusion_matrices(group_counts, rest_counts, pos_label)
+    tn, fp, fn, tp, tn2, fp2, fn2, tp2 = C
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stat_par = mtc.statistical_parity_difference(C)
+        eq_opp = mtc.equal_opportunity_difference(C)
+        avg_odds = ((_false_positive_rate(tn2, fp2) - _false_positive_rate(tn, fp)) +
+                    (mtc.recall(fn2, tp2) - mtc.recall(fn, tp))) / 2
+        acc = (tp + tn) / (tp + tn + fp + fn)
     return stat_par, eq_opp, avg_odds, acc
 
 
+def _bootstrap_fairness(group_counts, rest_counts, pos_label, n_bootstrap, confidence, rng):
+    """
+    Bootstrap confidence intervals of the subgroup fairness metrics for multiple groups at once.
+    The dataset is resampled with Poisson(1) weights per instance, i.e., the confusion counts of
+    each group and of the rest of the dataset are drawn from Poisson distributions (all replicates
+    in a single array operation).
+    @param group_counts: Count tensor of the groups, shape = (num_groups, 2, 2)
+    @type group_counts: np.ndarray
+    @param rest_counts: Count tensor of the rest of the dataset for each group, shape = (num_groups, 2, 2)
+    @type rest_counts: np.ndarray
+    @param pos_label: Positive (favorable) label (0 or 1)
+    @type pos_label: int
+    @param n_bootstrap: Number of bootstrap replicates
+    @type n_bootstrap: int
+    @param confidence: Confidence level of the intervals
+    @type confidence: float
+    @param rng: Random number generator
+    @type rng: np.random.Generator
+    @return: Lower and upper bounds per metric (see subgroup_fairness_metrics) and group, shape = (2, 4, num_groups)
+    @rtype: np.ndarray
+    """
+    size = (n_bootstrap,) + group_counts.shape
+    metrics = np.stack(subgroup_fairness_metrics(rng.poisson(group_counts, size), rng.poisson(rest_counts, size),
+                                                 pos_label))
+    with warnings.catch_warnings():     # all-NaN slices for groups that are empty in all replicates
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanquantile(metrics, [(1 - confidence) / 2, (1 + confidence) / 2], axis=1)
+
+
 def print_cluster_fairness(data, cluster_labels, groups, pos_label):
     # Compute fairness metrics
     general_fairness, subgroup_fairness, _, _ = cluster_fairness(data, cluster_labels, groups, pos_label)
@@ -222,7 +321,8 @@ def print_cluster_fairness(data, cluster_labels, groups, pos_label):
 
 
 def test_model_fairness(data, model=KMeans(), cluster_labels=None, pos_label=1, threshold=0.65, categ_columns=None,
-                        label_column='class', prediction_column='out', progress=lambda msg: None):
+                        label_column='class', prediction_column='out', progress=lambda msg: None, n_bins=None,
+                        x=None, cvi_mode='exact', n_bootstrap=None):
     """
     @param data: Dataset with ground-truth (column 'class') and predicted labels (column 'out').
     @type data: DataFrame
@@ -246,11 +346,22 @@ def test_model_fairness(data, model=KMeans(), cluster_labels=None, pos_label=1,
     @type prediction_column: str
     @param progress: Callback function to report progress on the task instance (celery)
     @type progress: Callable[str, None]
+    @param n_bins: Number of quantile bins for continuous features in the entropy-based subgroups or None
+    (every distinct value is a category)
+    @type n_bins: None or int
+    @param x: Numeric data prepared from the dataset (see util.prepare) or None to prepare it
+    @type x: None or np.ndarray
+    @param cvi_mode: Computation of the cluster validation indices, either 'exact' (bounded memory) or
+    'sample' (stratified sample with confidence interval of the silhouette score)
+    @type cvi_mode: str
+    @param n_bootstrap: Number of bootstrap replicates for confidence intervals of the subgroup fairness or None
+    @type n_bootstrap: None or int
     @return: Model fairness and other statistics
     @rtype: FairnessResult
     """
 
-    x = prepare(data, categ_columns=categ_columns, label_column=label_column, prediction_column=prediction_column)
+    if x is None:
+        x = prepare(data, categ_columns=categ_columns, label_column=label_column, prediction_column=prediction_column)
     if cluster_labels is None:
         # Train clustering model
         progress('Training clustering model ...')
@@ -265,6 +376,14 @@ def test_model_fairness(data, model=KMeans(), cluster_labels=None, pos_label=1,
     data_clustered = data_clustered.drop(labels=[label_column, prediction_column], axis=1)
     # data_clustered = data_clustered[data_clustered['cluster'] >= 0]  # remove outliers (cluster -1)
 
+    # Discretize continuous features into intervals
+    data_groups = data
+    if n_bins is not None:
+        progress('Binning continuous features ...')
+        binning = Binning(n_bins=n_bins).fit(data_clustered.drop(columns='cluster'))
+        data_clustered = binning.transform(data_clustered)
+        data_groups = binning.transform(data)
+
     # Subgroups via normalized cluster entropy
     progress('Computing entropy-based subgroups ...')
     g = normalized_entropy_groups(data_clustered, threshold=threshold)
@@ -273,23 +392,29 @@ def test_model_fairness(data, model=KMeans(), cluster_labels=None, pos_label=1,
     progress('Computing subgroup fairness metrics ...')
     with warnings.catch_warnings():  # catch warnings in this block
         warnings.simplefilter("ignore", category=UndefinedMetricWarning)
-        general_fairness, subgroup_fairness, priv_groups, group_sizes = \
-            cluster_fairness(data, clustering, g, pos_label=pos_label)
+        general_fairness, subgroup_fairness, priv_groups, group_sizes, *ci = \
+            cluster_fairness(data_groups, clustering, g, pos_label=pos_label, n_bootstrap=n_bootstrap)
 
-    return FairnessResult.create(general_fairness, subgroup_fairness, group_sizes, g, x, clustering)
+    return FairnessResult.create(general_fairness, subgroup_fairness, group_sizes, g, x, clustering,
+                                 cvi_mode=cvi_mode, ci=ci[0] if ci else None)
 
 
-def benchmark_clustering(models, dataset, pos_label=1):
+def benchmark_clustering(models, dataset, pos_label=1, n_jobs=None, time_budget=None):
     """
     Benchmark a set of clustering models and return results for the model
     with maximal value for the product of silhouette score and mean absolute
     cluster accuracy error.
-    @param models: List of cluster models
-    @type models: list of ClusterMixin
+    @param models: Cluster models (any iterable)
+    @type models: Iterable[ClusterMixin]
     @param dataset: Dataset with ground-truth (column 'class') and predicted labels (column 'out').
     @type dataset: pd.DataFrame
     @param pos_label: Positive (favorable) label (0 or 1)
     @type pos_label: int
+    @param n_jobs: Number of worker processes (-1 for all CPUs) or None to test the models one after another
+    @type n_jobs: None or int
+    @param time_budget: Wall-clock budget in seconds or None. Models that are not tested within the budget are skipped
+    (see iter_benchmark_clustering).
+    @type time_budget: None or float
     @return: Fairness and benchmark result of the best model that was tested:
     FairnessResult, mean absolute cluster accuracy error, silhouette score, params of the model)
     @rtype: (FairnessResult, float, float, dict)
@@ -300,16 +425,18 @@ def benchmark_clustering(models, dataset, pos_label=1):
     best_fair = None
     best_params = None
 
-    for m in models:
-        fair_res = test_model_fairness(dataset, model=m, pos_label=pos_label)
-
-        if max_prod < fair_res.c_acc.mean_abs_err * fair_res.cvi.sil:
+    for m, fair_res, score in iter_benchmark_clustering(models, dataset, pos_label=pos_label, n_jobs=n_jobs,
+                                                        time_budget=time_budget):
+        if max_prod < score:
             max_error = fair_res.c_acc.mean_abs_err
             max_sil = fair_res.cvi.sil
-            max_prod = max_error * max_sil
+            max_prod = score
             best_fair = fair_res
             best_params = m.get_params()
 
+    if best_fair is None:
+        raise TimeoutError(f"No clustering model could be tested within the time budget of {time_budget}s")
+
     print(
         f"Highest absolute mean error={max_error:0.4f} and silhouette={max_sil:0.4f} "
         f"for params={best_params} (duplication={best_fair.duplication})")
@@ -318,15 +445,112 @@ def benchmark_clustering(models, dataset, pos_label=1):
     return best_fair, max_error, max_sil, best_params
 
 
+def iter_benchmark_clustering(models, dataset, pos_label=1, n_jobs=None, time_budget=None):
+    """
+    Test the fairness of a set of clustering models and yield each result as soon as it is finished.
+    The numeric data is prepared only once. In parallel mode, the worker processes read the dataset from a
+    file and memory-map the numeric data from a .npy file, i.e., neither is pickled to the workers.
+    @param models: Cluster models (any iterable)
+    @type models: Iterable[ClusterMixin]
+    @param dataset: Dataset with ground-truth (column 'class') and predicted labels (column 'out').
+    @type dataset: pd.DataFrame
+    @param pos_label: Positive (favorable) label (0 or 1)
+    @type pos_label: int
+    @param n_jobs: Number of worker processes (-1 for all CPUs) or None to test the models one after another
+    @type n_jobs: None or int
+    @param time_budget: Wall-clock budget in seconds or None. When it is exceeded, the remaining models
+    are skipped and running workers are terminated. With a budget, models are always tested in worker
+    processes (a single one if n_jobs is None), such that a model that is being fitted can be stopped.
+    @type time_budget: None or float
+    @return: Generator of fitted model, fairness result and score (mean absolute cluster accuracy error
+    times silhouette score) in the order of completion
+    @rtype: Generator[(ClusterMixin, FairnessResult, float)]
+    """
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    models = list(models)
+    x = prepare(dataset)
+
+    if n_jobs is None and deadline is None:
+        for m in models:
+            yield _benchmark_model(m, dataset, x, pos_label)
+        return
+
+    n_jobs = 1 if n_jobs is None else os.cpu_count() if n_jobs < 0 else n_jobs
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, 'dataset.pkl')
+        dataset.to_pickle(data_path)
+        x_path = os.path.join(tmp, 'x.npy')
+        np.save(x_path, np.asarray(x, dtype=float))
+
+        pool = multiprocessing.Pool(n_jobs, initializer=_init_benchmark_worker,
+                                    initargs=(data_path, x_path, pos_label))
+        try:
+            results = pool.imap_unordered(_benchmark_worker, models)
+            for _ in range(len(models)):
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    yield results.next(timeout=timeout)
+                except multiprocessing.TimeoutError:
+                    return
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def _benchmark_model(model, dataset, x, pos_label):
+    """
+    Fit a clustering model and test its fairness.
+    @param model: Clustering model
+    @type model: ClusterMixin
+    @param dataset: Dataset with ground-truth (column 'class') and predicted labels (column 'out').
+    @type dataset: pd.DataFrame
+    @param x: Numeric data prepared from the dataset
+    @type x: np.ndarray
+    @param pos_label: Positive (favorable) label (0 or 1)
+    @type pos_label: int
+    @return: Fitted model, fairness result and score
+    @rtype: (ClusterMixin, FairnessResult, float)
+    """
+    fair_res = test_model_fairness(dataset, model=model, pos_label=pos_label, x=x)
+    return model, fair_res, fair_res.c_acc.mean_abs_err * fair_res.cvi.sil
+
+
+# Dataset, numeric data and positive label of a benchmark worker process
+_worker_args = None
+
+
+def _init_benchmark_worker(data_path, x_path, pos_label):
+    global _worker_args
+    threadpool_limits(limits=1)     # one process per CPU, avoid oversubscription by BLAS/OpenMP threads
+    _worker_args = (pd.read_pickle(data_path), np.load(x_path, mmap_mode='r'), pos_label)
+
+
+def _benchmark_worker(model):
+    dataset, x, pos_label = _worker_args
+    return _benchmark_model(model, dataset, x, pos_label)
+
+
 class FairnessResult:
     """
     Wrapper class for subgroup fairness analysis result with
     enabled JSON-serializability for transfer between celery
-    worker and calling process.
+    worker and calling process. For large results, the compact
+    binary format (to_bytes/from_bytes) should be preferred.
     """
 
     @classmethod
-    def create(cls, general_fairness, subgroup_fairness, group_sizes, g, x, cluster_labels):
+    def create(cls, general_fairness, subgroup_fairness, group_sizes, g, x, cluster_labels, cvi_mode='exact',
+               cvi_sample_size=10000, ci=None):
+        """
+        Summarize the result of a subgroup fairness analysis.
+        @param cvi_mode: Computation of the cluster validation indices, either 'exact' or 'sample'
+        (see clustering.validate_clustering)
+        @type cvi_mode: str
+        @param cvi_sample_size: Number of instances to sample for the silhouette score (mode 'sample')
+        @type cvi_sample_size: int
+        @param ci: Bootstrap confidence intervals of the subgroup fairness or None (see cluster_fairness)
+        @type ci: None or DataFrame
+        """
         res = cls()
         res.fair = DataFrame(data={'mean': subgroup_fairness.mean().values,
                                    'std': subgroup_fairness.std().values,
@@ -354,16 +578,19 @@ class FairnessResult:
 
         # Groups
         res.subgroups = g
-        res.duplication = subgroup_fairness.g_acc.isna().sum() / len(g)  # rate of duplicate groups
+        is_duplicated = g.duplicated().reindex(subgroup_fairness.index, fill_value=False)
+        res.duplication = (subgroup_fairness.g_acc.isna() | is_duplicated).sum() / len(g)  # rate of duplicate groups
         res.group_sizes = group_sizes
 
         # Cluster validation
         # res.model = m        # cannot be serialized easily
         res.clustering = cluster_labels
-        res.cvi = validate_clustering(x, cluster_labels)
+        res.cvi = validate_clustering(x, cluster_labels, mode=cvi_mode, sample_size=cvi_sample_size)
+        res.cvi_mode = cvi_mode
 
         # Raw data
         res.raw = subgroup_fairness
+        res.ci = ci
 
         return res
 
@@ -377,7 +604,9 @@ class FairnessResult:
             "duplication": self.duplication,
             "clustering": self.clustering.tolist(),
             "cvi": self.cvi.to_json(),
-            "raw": self.raw.to_json()
+            "cvi_mode": self.cvi_mode,
+            "raw": self.raw.to_json(),
+            "ci": None if self.ci is None else self.ci.to_json()
         })
 
     @classmethod
@@ -393,6 +622,108 @@ class FairnessResult:
         res.duplication = parsed["duplication"]
         res.clustering = parsed["clustering"]
         res.cvi = parsed["cvi"]
+        res.cvi_mode = parsed.get("cvi_mode", 'exact')
         res.raw = parsed["raw"]
+        res.ci = parsed.get("ci")
+
+        return res
+
+    # Binary format: magic, header length (uint64), JSON header, arrays (each aligned to _ALIGN bytes)
+    _MAGIC = b'FAIRRES1'
+    _ALIGN = 64
+
+    def to_bytes(self):
+        """
+        Serialize the result into a compact binary format. The frames are stored in columnar form
+        (one array per column, the subgroups as Arrow IPC stream to keep the types of their values,
+        e.g., intervals of binned features) and the cluster labels with the narrowest integer type.
+        @return: Serialized result
+        @rtype: bytes
+        """
+        labels = np.asarray(self.clustering)
+        if labels.size > 0:
+            labels = labels.astype(np.result_type(np.min_scalar_type(labels.min()), np.min_scalar_type(labels.max())))
+
+        subgroups = pa.Table.from_pandas(self.subgroups)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, subgroups.schema) as writer:
+            writer.write_table(subgroups)
+
+        arrays = {'clustering': labels, 'subgroups': np.frombuffer(sink.getvalue(), dtype=np.uint8)}
+        meta = {
+            'group_sizes': self.group_sizes,
+            'duplication': float(self.duplication),
+            'cvi_mode': self.cvi_mode,
+        }
+        for name in ('fair', 'raw', 'ci'):
+            frame = getattr(self, name)
+            if frame is None:
+                continue
+            meta[name] = {'columns': frame.columns.tolist(), 'index': frame.index.tolist()}
+            arrays.update({f'{name}/{i}': frame[col].to_numpy() for i, col in enumerate(frame.columns)})
+        for name in ('c_acc', 'g_acc', 'cvi'):
+            series = getattr(self, name)
+            meta[name] = {'index': series.index.tolist()}
+            arrays[name] = series.to_numpy(dtype=float)
+
+        # Array offsets relative to the (aligned) end of the header
+        specs, offset = {}, 0
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            arrays[name] = arr
+            specs[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+            offset += -(-arr.nbytes // self._ALIGN) * self._ALIGN
+        header = json.dumps({'meta': meta, 'arrays': specs}).encode()
+
+        start = -(-(len(self._MAGIC) + 8 + len(header)) // self._ALIGN) * self._ALIGN
+        buf = bytearray(start + offset)
+        buf[:len(self._MAGIC)] = self._MAGIC
+        buf[len(self._MAGIC):len(self._MAGIC) + 8] = np.uint64(len(header)).tobytes()
+        buf[len(self._MAGIC) + 8:len(self._MAGIC) + 8 + len(header)] = header
+        for name, arr in arrays.items():
+            pos = start + specs[name]['offset']
+            buf[pos:pos + arr.nbytes] = arr.tobytes()
+        return bytes(buf)
+
+    @classmethod
+    def from_bytes(cls, buf):
+        """
+        Deserialize a result from the binary format (see to_bytes). The cluster labels and the series
+        are read-only views into the buffer, the frames are copied (their columns are consolidated by pandas).
+        @param buf: Serialized result
+        @type buf: bytes or memoryview
+        @return: Fairness result
+        @rtype: FairnessResult
+        """
+        buf = memoryview(buf)
+        if bytes(buf[:len(cls._MAGIC)]) != cls._MAGIC:
+            raise ValueError("Buffer does not contain a serialized FairnessResult")
+        header_len = int(np.frombuffer(buf, dtype=np.uint64, count=1, offset=len(cls._MAGIC))[0])
+        header_start = len(cls._MAGIC) + 8
+        header = json.loads(bytes(buf[header_start:header_start + header_len]))
+        start = -(-(header_start + header_len) // cls._ALIGN) * cls._ALIGN
+
+        def array(name):
+            spec = header['arrays'][name]
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            return np.frombuffer(buf, dtype=dtype, count=count, offset=start + spec['offset']).reshape(spec['shape'])
+
+        res = cls()
+        meta = header['meta']
+        res.ci = None
+        for name in ('fair', 'raw', 'ci'):
+            if name not in meta:
+                continue
+            columns = meta[name]['columns']
+            setattr(res, name, DataFrame({col: array(f'{name}/{i}') for i, col in enumerate(columns)},
+                                         index=meta[name]['index'], columns=columns, copy=False))
+        for name in ('c_acc', 'g_acc', 'cvi'):
+            setattr(res, name, Series(array(name), index=meta[name]['index'], copy=False))
+        res.subgroups = pa.ipc.open_stream(pa.py_buffer(array('subgroups'))).read_all().to_pandas()
+        res.group_sizes = meta['group_sizes']
+        res.duplication = meta['duplication']
+        res.cvi_mode = meta['cvi_mode']
+        res.clustering = array('clustering')
 
         return res
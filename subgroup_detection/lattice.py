@@ -0,0 +1,158 @@
+import heapq
+import logging
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from subgroup_detection.bitmap import BitmapIndex
+from subgroup_detection.fairness import subgroup_fairness_metrics
+
+log = logging.getLogger()
+
+
+def lattice_subgroups(data, pos_label=1, top_k=10, min_support=0.05, max_length=None, metric='stat_par',
+                      categ_columns=None, label_column='class', prediction_column='out', time_budget=None,
+                      memory_budget=256, batch_size=None):
+    """Search the most unfair subgroups by an exhaustive (Apriori-style) search in the lattice of conjunctive
+    patterns over the categorical attributes of the dataset.
+
+    The patterns are grown level by level, i.e., a pattern of length l + 1 is the join of two frequent patterns
+    of length l with the same prefix. Since the support is anti-monotone, candidates with an infrequent subpattern
+    are pruned without counting. The rows of a pattern are the intersection of the bitsets of its parents
+    and the confusion counts of each pattern are popcounts against the bitsets of the class and prediction.
+
+    :param pd.DataFrame data: Dataset with ground-truth and predicted labels
+    :param int pos_label: Positive (favorable) label (0 or 1)
+    :param int top_k: Number of subgroups to return
+    :param float min_support: Minimal fraction of instances covered by a pattern
+    :param None or int max_length: Maximal number of attribute-value pairs of a pattern or None
+    :param str metric: Unfairness score (absolute value), either 'stat_par' (statistical parity difference)
+        or 'avg_odds' (average odds difference)
+    :param None or list of str categ_columns: Attributes of the patterns or None. If None, then all columns
+        with type 'category', 'object' or 'bool' are used
+    :param str label_column: Name of column with ground-truth class labels
+    :param str prediction_column: Name of column with predicted class labels
+    :param None or float time_budget: Wall-clock budget in seconds or None. When it is exceeded, the search
+        stops and returns the best subgroups found so far
+    :param float memory_budget: Memory ceiling in MiB for the bitsets of a level (half of the budget, candidates
+        beyond it are skipped) and the temporary bitsets of intersecting a batch of candidates (other half)
+    :param None or int batch_size: Number of candidates to intersect at once or None. The batch size is limited
+        by the memory budget in either case
+    :return: Top-k subgroups (patterns in the format of metrics.subgroups_to_cluster_patterns), their sizes and
+        fairness metrics, sorted by decreasing unfairness
+    :rtype: pd.DataFrame
+    """
+    if metric not in ('stat_par', 'avg_odds'):
+        raise ValueError(f"Unknown fairness metric '{metric}'")
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    if categ_columns is None:
+        categ_columns = [col for col in data.columns if col not in (label_column, prediction_column) and
+                         (pd.api.types.is_object_dtype(data[col]) or isinstance(data[col].dtype, pd.CategoricalDtype)
+                          or pd.api.types.is_bool_dtype(data[col]))]
+
+    index = BitmapIndex(data)
+    true_bits = index.pack(data[label_column].to_numpy() == 1)
+    pred_bits = index.pack(data[prediction_column].to_numpy() == 1)
+    total_counts = index.confusion_counts(index.pack(np.ones(len(data), dtype=bool)), true_bits, pred_bits)
+    min_count = max(int(np.ceil(min_support * len(data))), 1)
+    # Half of the budget for the bitsets of a level, the other half for the batches of intersections,
+    # each of which needs about three bitsets per candidate (both operands and the result)
+    bitset_bytes = max(len(true_bits), 1)
+    max_patterns = max(int(memory_budget * 2 ** 20 / 2 // bitset_bytes), 1)
+    max_batch_size = max(int(memory_budget * 2 ** 20 / 2 // (3 * bitset_bytes)), 1)
+    batch_size = max_batch_size if batch_size is None else min(batch_size, max_batch_size)
+
+    # Level 1: frequent attribute-value pairs
+    items = [(col, value) for col in categ_columns
+             for value, count in data[col].value_counts(sort=False).items() if count >= min_count]
+    item_columns = np.array([categ_columns.index(col) for col, _ in items], dtype=int)
+    patterns = [(i,) for i in range(len(items))]
+    bits = np.stack([index.bitset(col, value) for col, value in items]) if items \
+        else np.zeros((0, len(true_bits)), dtype=np.uint8)
+
+    top = []   # heap of (score, pattern, size, stat_par, avg_odds)
+    length = 1
+    while patterns:
+        _score_patterns(index, patterns, bits, true_bits, pred_bits, total_counts, pos_label, metric, top_k, top)
+        if (max_length is not None and length >= max_length) or _exceeded(deadline):
+            break
+        patterns, bits = _next_level(patterns, bits, item_columns, index, min_count, max_patterns, batch_size,
+                                     deadline)
+        length += 1
+
+    top = sorted(top, reverse=True)
+    return pd.DataFrame({
+        'pattern': [[(items[i][0], '=', items[i][1]) for i in p] for _, p, _, _, _ in top],
+        'size': [size for _, _, size, _, _ in top],
+        'stat_par': [stat_par for _, _, _, stat_par, _ in top],
+        'avg_odds': [avg_odds for _, _, _, _, avg_odds in top],
+    })
+
+
+def _exceeded(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def _score_patterns(index, patterns, bits, true_bits, pred_bits, total_counts, pos_label, metric, top_k, top):
+    """Compute the fairness of all patterns of a level and update the top-k heap."""
+    counts = index.confusion_counts(bits, true_bits, pred_bits)
+    stat_par, _, avg_odds, _ = subgroup_fairness_metrics(counts, total_counts - counts, pos_label)
+    scores = np.abs(stat_par if metric == 'stat_par' else avg_odds)
+    sizes = counts.sum(axis=(-2, -1))
+
+    # Only the best top_k patterns of the level can enter the heap
+    valid = np.flatnonzero(~np.isnan(scores))
+    if len(valid) > top_k:
+        valid = valid[np.argpartition(scores[valid], -top_k)[-top_k:]]
+    for i in valid:
+        entry = (float(scores[i]), patterns[i], int(sizes[i]), float(stat_par[i]), float(avg_odds[i]))
+        if len(top) < top_k:
+            heapq.heappush(top, entry)
+        elif entry > top[0]:
+            heapq.heapreplace(top, entry)
+
+
+def _next_level(patterns, bits, item_columns, index, min_count, max_patterns, batch_size, deadline):
+    """Join the frequent patterns of a level with a common prefix into the frequent patterns of the next level."""
+    frequent = set(patterns)
+    prefixes = defaultdict(list)
+    for i, p in enumerate(patterns):
+        prefixes[p[:-1]].append(i)
+
+    # Candidates: pairs of patterns with the same prefix and last items of different attributes,
+    # all of whose subpatterns are frequent (anti-monotonicity of the support)
+    left, right = [], []
+    for members in prefixes.values():
+        for a, i in enumerate(members):
+            p = patterns[i]
+            for j in members[a + 1:]:
+                last = patterns[j][-1]
+                if item_columns[p[-1]] == item_columns[last]:
+                    continue
+                candidate = p + (last,)
+                if all(candidate[:m] + candidate[m + 1:] in frequent for m in range(len(candidate) - 2)):
+                    left.append(i)
+                    right.append(j)
+
+    next_patterns, next_bits = [], []
+    left, right = np.array(left, dtype=int), np.array(right, dtype=int)
+    for lo in range(0, len(left), batch_size):
+        if _exceeded(deadline):
+            log.warning("Time budget exceeded, subgroup search stopped")
+            break
+        i, j = left[lo:lo + batch_size], right[lo:lo + batch_size]
+        joined = bits[i] & bits[j]
+        keep = np.flatnonzero(index.count(joined) >= min_count)
+        if sum(len(b) for b in next_bits) + len(keep) > max_patterns:
+            log.warning("Memory budget exceeded, subgroup search skips candidates")
+            keep = keep[:max_patterns - sum(len(b) for b in next_bits)]
+        next_patterns.extend(patterns[i[k]] + (patterns[j[k]][-1],) for k in keep)
+        next_bits.append(joined[keep])
+        if len(next_patterns) >= max_patterns:
+            break
+
+    if not next_patterns:
+        return [], np.zeros((0, bits.shape[1]), dtype=np.uint8)
+    return next_patterns, np.concatenate(next_bits)
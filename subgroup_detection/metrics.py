@@ -1,10 +1,11 @@
 import operator
-from functools import reduce
+from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
 from sklearn.metrics import confusion_matrix
 
+from subgroup_detection.bitmap import BitmapIndex
 from subgroup_detection.util import _dict_avg, _dict_map, _dict_min, _dict_max, _dict_apply
 
 
@@ -13,6 +14,154 @@ class UndefinedOperatorError(ValueError):
         super().__init__(f"Operator '{op}' is not defined")
 
 
+_OPERATORS = {'=': operator.eq, '!=': operator.ne, '<=': operator.le, '>=': operator.ge}
+
+
+class PatternEvaluator:
+    """Evaluation of conjunctive patterns on a fixed dataset.
+
+    Patterns are compiled once into tuples of atomic predicates (col, op, val). The masks of
+    the atomic predicates and of whole patterns are cached with LRU eviction, i.e., repeated
+    evaluations of the same patterns (or of patterns sharing predicates) do not scan the dataset
+    again. All metric functions of this module accept an evaluator instead of the dataset.
+
+    Optionally, numeric columns are indexed by a sorted permutation of their rows, such that
+    the rows of a range predicate ('<=', '>=' or '=') are a slice of the permutation found by
+    binary search. For selective patterns, only the rows of the most selective range are then
+    checked against the other predicates instead of scanning the columns of all predicates.
+    """
+
+    def __init__(self, data, maxsize=1024, range_index=False):
+        """
+        :param pd.DataFrame data: The original dataset (not preprocessed).
+        :param int maxsize: Maximal number of cached masks (each for predicates and patterns)
+        :param bool range_index: Whether to index numeric columns by their sorted values
+        """
+        self.data = data
+        self.maxsize = maxsize
+        self.range_index = range_index
+        self._predicates = OrderedDict()
+        self._patterns = OrderedDict()
+        self._sorted = {}
+        self._values = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, col):
+        return self.data[col]
+
+    @staticmethod
+    def compile(p):
+        """Compile a conjunctive pattern into a canonical tuple of atomic predicates.
+
+        :param list of (str, str, Any) p: Conjunctive pattern.
+        :return: Atomic predicates (sorted, without duplicates)
+        :rtype: tuple of (str, str, Any)
+        """
+        for _, op, _ in p:
+            if op not in _OPERATORS:
+                raise UndefinedOperatorError(op)
+        return tuple(sorted(set(p), key=repr))
+
+    def predicate_index(self, predicate):
+        """Filter on the index of the dataset for a single attribute-value constraint.
+
+        :param (str, str, Any) predicate: Atomic predicate (col, op, val).
+        :return: Filter on the index of the dataset (read-only boolean array).
+        :rtype: np.ndarray
+        """
+        return self._cached(self._predicates, predicate, lambda: self._evaluate(predicate))
+
+    def index(self, p):
+        """Filter on the index of the dataset for a conjunctive pattern.
+
+        :param list of (str, str, Any) p: Conjunctive pattern.
+        :return: Filter on the index of the dataset (read-only boolean array).
+        :rtype: np.ndarray
+        """
+        predicates = self.compile(p)
+        return self._cached(self._patterns, predicates, lambda: self._conjunction(predicates))
+
+    def _evaluate(self, predicate):
+        col, op, val = predicate
+        return np.asarray(_OPERATORS[op](self.data[col], val), dtype=bool)
+
+    def _conjunction(self, predicates):
+        # Row ids of the range predicates, combined per column into a single slice of the sorted index
+        n = len(self.data)
+        ranges = {}
+        for predicate in predicates:
+            bounds = self._range(predicate)
+            if bounds is not None:
+                col = predicate[0]
+                lo, hi = ranges.get(col, (0, n))
+                ranges[col] = (max(lo, bounds[0]), min(hi, bounds[1]))
+        ranges = {col: self._sorted[col][0][lo:max(lo, hi)] for col, (lo, hi) in ranges.items()}
+
+        # Plan: start with the row ids of the most selective column range, if they are few enough that
+        # (8-byte) row ids are cheaper than (1-byte) masks of the entire dataset, otherwise combine masks
+        if ranges:
+            first = min(ranges, key=lambda col: len(ranges[col]))
+            if 8 * len(ranges[first]) < n:
+                return self._conjunction_ids(predicates, ranges, first)
+
+        idx = np.ones(n, dtype=bool)
+        for predicate in predicates:
+            idx &= self.predicate_index(predicate)
+        return idx
+
+    def _conjunction_ids(self, predicates, ranges, first):
+        # The other predicates select at least as many rows, so instead of intersecting their row ids
+        # (sorting), they are evaluated on the remaining rows only (including those of the first column
+        # that are not part of its range, i.e., '!=')
+        ids = ranges[first]
+        for predicate in predicates:
+            col, op, val = predicate
+            if col == first and self._range(predicate) is not None:
+                continue
+            if len(ids) == 0:
+                break
+            if col not in self._values:
+                self._values[col] = self.data[col].to_numpy()
+            ids = ids[np.asarray(_OPERATORS[op](self._values[col][ids], val), dtype=bool)]
+        idx = np.zeros(len(self.data), dtype=bool)
+        idx[ids] = True
+        return idx
+
+    def _range(self, predicate):
+        """Bounds of the rows of a range predicate in the sorted index of its column (None if not indexed)."""
+        col, op, val = predicate
+        if not self.range_index or op == '!=' or not pd.api.types.is_numeric_dtype(self.data[col]) \
+                or not np.isscalar(val) or isinstance(val, (str, bytes)):
+            return None
+        if col not in self._sorted:
+            values = self.data[col].to_numpy(dtype=float)
+            order = np.argsort(values, kind='stable')
+            order = order[~np.isnan(values[order])]     # missing values do not satisfy any range
+            self._sorted[col] = (order, values[order])
+        _, values = self._sorted[col]
+        lo = np.searchsorted(values, val, side='left') if op in ('>=', '=') else 0
+        hi = np.searchsorted(values, val, side='right') if op in ('<=', '=') else len(values)
+        return lo, hi
+
+    def _cached(self, cache, key, compute):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        value = compute()
+        value.flags.writeable = False
+        cache[key] = value
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return value
+
+
+def _evaluator(data):
+    """Get a pattern evaluator for the dataset (or the given evaluator)."""
+    return data if isinstance(data, PatternEvaluator) else PatternEvaluator(data)
+
+
 def statistical_parity_difference(C):
     """
     Compute the statistical parity difference for the given confusion matrices.
@@ -77,9 +226,7 @@ def recall(fn, tp):
     :return: Recall score.
     :rtype: float
     """
-    if tp + fn > 0:
-        return tp / (tp + fn)
-    return 0
+    return _safe_divide(tp, tp + fn)
 
 
 def specificity(tn, fp):
@@ -91,9 +238,21 @@ def specificity(tn, fp):
     :return: Specificity score.
     :rtype: float
     """
-    if fp + tn > 0:
-        return fp / (fp + tn)
-    return 0
+    return _safe_divide(fp, fp + tn)
+
+
+def _safe_divide(a, b):
+    """
+    Divide a by b with 0 for zero denominators (element-wise for arrays of counts).
+
+    :param int or np.ndarray a: Numerator.
+    :param int or np.ndarray b: Denominator.
+    :return: Quotient.
+    :rtype: float or np.ndarray
+    """
+    if np.ndim(b) == 0:
+        return a / b if b > 0 else 0
+    return np.divide(a, b, out=np.zeros(np.shape(b)), where=np.asarray(b) > 0)
 
 
 def compute_metrics(cluster_patterns, data, pos_label=1):
@@ -103,24 +262,26 @@ def compute_metrics(cluster_patterns, data, pos_label=1):
     
     :param dict of (list of (str, str, Any)) cluster_patterns: List of conjunctive 
         patterns for each cluster
-    :param pd.DataFrame data: The original dataset (not preprocessed) 
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed) 
         incl. ground-truth ('class') and predicted ('out') labels.
     :param int pos_label: Label of the positive class (0 or 1).
     :return: Dataframe with one row for each cluster (pattern)
     :rtype: pd.DataFrame
     """
-    res = pd.DataFrame(columns=['Stat. parity diff.', 'Eq. opportunity diff.', 'Avg. odds diff.'])
-    for c in cluster_patterns:
-        p = cluster_patterns[c]
-        C = conf_matrix(data, p, pos_label=pos_label)
-        res.loc[c] = [statistical_parity_difference(C), equal_opportunity_difference(C), average_odds_difference(C)]
-    return res
+    C = conf_matrices(pattern_membership(cluster_patterns, data), data, pos_label=pos_label)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = np.column_stack([statistical_parity_difference(C), equal_opportunity_difference(C),
+                               average_odds_difference(C)])
+    return pd.DataFrame(res, index=list(cluster_patterns),
+                        columns=['Stat. parity diff.', 'Eq. opportunity diff.', 'Avg. odds diff.'])
 
 
 def subgroups_to_cluster_patterns(subgroups):
     """
     Transform the given entropy-based subgroups (patterns in form of a dataframe)
-    to a dictionary of conjunctive patterns (list of tuples).
+    to a dictionary of conjunctive patterns (list of tuples). Interval values of
+    binned continuous features (closed intervals, see binning.Binning) are transformed
+    to range constraints '(col >= left) ^ (col <= right)'.
     
     :param pd.DataFrame subgroups: Entropy-based subgroups in a DataFrame (each row is a subgroup)
     :return: Dictionary of conjunctive patterns (list of (feature, op, value)-tuples)
@@ -128,7 +289,14 @@ def subgroups_to_cluster_patterns(subgroups):
     """
     cluster_patterns = {}
     for c, row in subgroups.iterrows():
-        p = [(fn, '=', val) for fn, val in row.dropna().items()]
+        p = []
+        for fn, val in row.dropna().items():
+            if isinstance(val, pd.Interval):
+                if not val.closed_left or not val.closed_right:
+                    raise UndefinedOperatorError('>' if val.open_left else '<')
+                p += [(fn, '>=', val.left), (fn, '<=', val.right)]
+            else:
+                p.append((fn, '=', val))
         cluster_patterns[c] = p
     return cluster_patterns
 
@@ -137,32 +305,20 @@ def pattern_to_index(data, p):
     """
     Transform the patterns on the given dataset to a filter on the index (boolean array).
     
-    :param pd.DataFrame data: The original dataset (not preprocessed).
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
     :param list of (str, Any, Any) p: Conjunctive pattern (e.g., for a single cluster).
     :return: Filter on the index of the dataset (boolean array).
-    :rtype: list of bool
-    """
-    conditions = []
-    for pattern in p:
-        col, op, val = pattern
-        if op == '=':
-            conditions.append(data[col] == val)
-        elif op == '!=':
-            conditions.append(data[col] != val)
-        elif op == '<=':
-            conditions.append(data[col] <= val)
-        elif op == '>=':
-            conditions.append(data[col] >= val)
-        else:
-            raise UndefinedOperatorError(op)
-    return reduce(operator.and_, conditions)
+    :rtype: pd.Series
+    """
+    data = _evaluator(data)
+    return pd.Series(data.index(p), index=data.data.index)
 
 
 def conf_matrix(data, p, pos_label=1):
     """
     Get the confusion matrices of the privileged and unprivileged subgroup.
     
-    :param pd.DataFrame data: Dataset with ground-truth and predicted labels
+    :param pd.DataFrame or PatternEvaluator data: Dataset with ground-truth and predicted labels
     :param list of (str, str, Any) p: Conjunctive pattern defining a single subgroup
     :param int pos_label: Label of the positive (favorable) class (0 or 1).
     :return: tn, fp, fn, tp, tn2, fp2, fn2, tp2 (privileged & unprivileged subgroup)
@@ -187,6 +343,38 @@ def conf_matrix(data, p, pos_label=1):
     return tn, fp, fn, tp, tn2, fp2, fn2, tp2
 
 
+def conf_matrices(membership, data, pos_label=1, chunk_size=1024):
+    """
+    Get the confusion matrices of the privileged and unprivileged subgroup for many patterns at once
+    (same as conf_matrix for each pattern). The counts of the unprivileged subgroups (rest) are the
+    total counts minus the counts of the privileged subgroups.
+
+    :param np.ndarray membership: Packed membership matrix of the patterns (see pattern_membership)
+    :param pd.DataFrame or PatternEvaluator data: Dataset with ground-truth and predicted labels
+    :param int pos_label: Label of the positive (favorable) class (0 or 1).
+    :param int chunk_size: Number of patterns whose bitsets are intersected with the labels at once
+    :return: tn, fp, fn, tp, tn2, fp2, fn2, tp2 (privileged & unprivileged subgroup, one entry per pattern)
+    :rtype: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+    """
+    if pos_label not in (0, 1):
+        raise ValueError(f"Positive label must be 0 or 1, got {pos_label}")
+    bitmap = BitmapIndex(data)
+    y_true = bitmap.pack(np.asarray(data['class']) == 1)
+    y_pred = bitmap.pack(np.asarray(data['out']) == 1)
+
+    # Counts of the cells (class, out) = (0, 0), (0, 1), (1, 0), (1, 1) per pattern and in total
+    group = np.zeros((len(membership), 4), dtype=np.int64)
+    for lo in range(0, len(membership), chunk_size):
+        group[lo:lo + chunk_size] = bitmap.confusion_counts(membership[lo:lo + chunk_size], y_true, y_pred) \
+            .reshape(-1, 4)
+    total = bitmap.confusion_counts(bitmap.pack(np.ones(len(data), dtype=bool)), y_true, y_pred).ravel()
+    rest = total - group
+
+    # Order the cells as (tn, fp, fn, tp) w.r.t. the positive label
+    order = [0, 1, 2, 3] if pos_label == 1 else [3, 2, 1, 0]
+    return tuple(group[:, i] for i in order) + tuple(rest[:, i] for i in order)
+
+
 def pattern_support(p, data):
     """
     Compute the support of a given conjunctive pattern, i.e., the ratio
@@ -196,7 +384,7 @@ def pattern_support(p, data):
         '(col op val) ^ (col2 op val2) ^ ...' where operators in the form of
         booleans are '=' (True) or '!=' (False). The conjunctive pattern is
         presented as a list of the individual attribute-value pairs.
-    :param pd.DataFrame data: The original dataset (not preprocessed).
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
     :return: Support of the conjunctive pattern
     :rtype: float
     """
@@ -210,10 +398,11 @@ def cluster_pattern_support(cluster_patterns, data):
     
     :param dict of (list of (str, str, Any)) cluster_patterns: Dict of conjunctive
         patterns for each cluster.
-    :param pd.DataFrame data: The original dataset (not preprocessed).
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
     :return: Support per pattern
     :rtype: dict of float
     """
+    data = _evaluator(data)
     return {c: pattern_support(p, data) for c, p in cluster_patterns.items()}
 
 
@@ -224,7 +413,7 @@ def containment_score(p, p_list, data):
 
     :param list of (str, str, Any) p: Single conjunctive pattern.
     :param list of (list of (str, str, Any)) p_list: List of conjunctive patterns.
-    :param pd.DataFrame data: The original dataset (not preprocessed).
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
     :return: Containment score of p compared to all patterns in p_list
     :rtype: float
     """
@@ -244,16 +433,55 @@ def cluster_containment_score(cluster_patterns, data):
 
     :param dict of (int, list of (str, str, Any)) cluster_patterns: Dict of conjunctive
         patterns for each cluster.
-    :param pd.DataFrame data: The original dataset (not preprocessed).
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
     :return: Containment score per pattern
     :rtype: dict of float
+    :raises ValueError: If there are less than two patterns (no other pattern to compare to)
+    """
+    if len(cluster_patterns) < 2:
+        raise ValueError("Containment scores require at least two patterns")
+    inter = pattern_intersections(pattern_membership(cluster_patterns, data))
+    sizes = np.diag(inter)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = inter / sizes[:, np.newaxis]
+    np.fill_diagonal(scores, -np.inf)   # compare to all other patterns only
+    return dict(zip(cluster_patterns, scores.max(axis=1)))
+
+
+def pattern_membership(cluster_patterns, data):
+    """Compute the membership matrix of the patterns, i.e., for each pattern a bitset of the
+    instances that satisfy it (bitsets of BitmapIndex, padded to whole 64-bit words).
+
+    :param dict of (list of (str, str, Any)) cluster_patterns: Dict of conjunctive
+        patterns for each cluster.
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
+    :return: Packed membership matrix, shape = (num_patterns, 8 * ceil(n / 64))
+    :rtype: np.ndarray
+    """
+    data = _evaluator(data)
+    bitmap = BitmapIndex(data)
+    membership = np.zeros((len(cluster_patterns), 8 * -(-len(data) // 64)), dtype=np.uint8)
+    for i, p in enumerate(cluster_patterns.values()):
+        membership[i] = bitmap.pack(data.index(p))
+    return membership
+
+
+def pattern_intersections(membership, chunk_size=8192):
+    """Compute the sizes of the pairwise intersections of patterns by a matrix product of the
+    membership matrix with itself (in chunks of the instances).
+
+    :param np.ndarray membership: Packed membership matrix (see pattern_membership)
+    :param int chunk_size: Number of bytes (8 instances each) per chunk of the product
+    :return: Number of instances satisfying both patterns i and j (pattern sizes on the diagonal),
+        shape = (num_patterns, num_patterns)
+    :rtype: np.ndarray
     """
-    containment = {}
-    for c, p in cluster_patterns.items():
-        other_patterns = cluster_patterns.copy()
-        other_patterns.pop(c)
-        containment[c] = containment_score(p, other_patterns.values(), data)
-    return containment
+    k = len(membership)
+    inter = np.zeros((k, k), dtype=np.int64)
+    for lo in range(0, membership.shape[1], chunk_size):
+        block = np.unpackbits(membership[:, lo:lo + chunk_size], axis=1).astype(np.float32)
+        inter += np.rint(block @ block.T).astype(np.int64)     # exact, counts per chunk are < 2^24
+    return inter
 
 
 def cluster_pattern_size(cluster_patterns):
@@ -283,13 +511,13 @@ def fidelity(p, c, data, labels):
 
     :param list of (str, str, Any) p: Single conjunctive pattern
     :param int c: Cluster number
-    :param pd.DataFrame data: The original dataset (not preprocessed).
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
     :param list of int labels: Cluster labels
     :return: Fidelity of p
     :rtype: float
     """
     idx = pattern_to_index(data, p)
-    cluster_idx = labels == c
+    cluster_idx = np.asarray(labels) == c
     return (idx & cluster_idx).sum() / idx.sum()
 
 
@@ -298,13 +526,20 @@ def cluster_fidelity(cluster_patterns, data, labels):
 
     :param dict of (list of (str, str, Any)) cluster_patterns: Dict of conjunctive
         patterns for each cluster.
-    :param pd.DataFrame data: The original dataset (not preprocessed).
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
     :param list of int labels: Cluster labels
     :return: Fidelity of each pattern
     :rtype: dict of float
     """
-    # Compute the fidelity for each pattern/cluster
-    return {c: fidelity(p, c, data, labels) for c, p in cluster_patterns.items()}
+    # Compute the fidelity for each pattern/cluster from the membership matrix
+    labels = np.asarray(labels)
+    membership = pattern_membership(cluster_patterns, data)
+    bitmap = BitmapIndex(data)
+    clusters = np.stack([bitmap.pack(labels == c) for c in cluster_patterns]) if cluster_patterns \
+        else membership
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = BitmapIndex.count(membership & clusters) / BitmapIndex.count(membership)
+    return dict(zip(cluster_patterns, scores))
 
 
 def cluster_coverage(cluster_patterns, data):
@@ -313,14 +548,13 @@ def cluster_coverage(cluster_patterns, data):
 
     :param dict of (list of (str, str, Any)) cluster_patterns: Dict of conjunctive
         patterns for each cluster.
-    :param pd.DataFrame data: The original dataset (not preprocessed).
+    :param pd.DataFrame or PatternEvaluator data: The original dataset (not preprocessed).
     :return: Coverage of the patterns on the dataset
     :rtype: float
     """
-    idx = [False] * len(data)
-    for c, p in cluster_patterns.items():
-        idx = idx | pattern_to_index(data, p)       # concatenate all index lists with logical or
-    return idx.sum() / len(data)        # ratio of instances affected by a pattern
+    membership = pattern_membership(cluster_patterns, data)
+    covered = np.bitwise_or.reduce(membership, axis=0)      # instances satisfying any of the patterns
+    return BitmapIndex.count(covered) / len(data)        # ratio of instances affected by a pattern
 
 
 def pattern_jaccard(p1, p2):
@@ -347,6 +581,7 @@ def cluster_pattern_avg_jaccard(cluster_patterns_1, cluster_patterns_2):
 
 
 def print_pattern_metrics(cluster_patterns, data, labels):
+    data = _evaluator(data)     # evaluate each pattern only once for all metrics
     size = cluster_pattern_size(cluster_patterns)
     print(f"Pattern size:\t\t{_dict_avg(size)} ({_dict_min(size)} - {_dict_max(size)})")
     support = cluster_pattern_support(cluster_patterns, data)
@@ -0,0 +1,154 @@
+import tracemalloc
+import unittest
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.datasets import make_blobs
+from sklearn.metrics import silhouette_score, davies_bouldin_score, calinski_harabasz_score
+from sklearn.tree import DecisionTreeClassifier
+from subgroup_detection import clustering, metrics
+
+X, L = make_blobs(n_samples=2000, centers=4, n_features=3, random_state=0)
+L[:3] = 4     # small cluster
+L[3] = 5      # singleton cluster
+
+
+class MyTestCase(unittest.TestCase):
+    def test_validate_clustering(self):
+        expected = [silhouette_score(X, L), davies_bouldin_score(X, L), calinski_harabasz_score(X, L)]
+        for working_memory in (64, 1):      # single chunk or ~30 chunks of rows
+            cvi = clustering.validate_clustering(X, L, working_memory=working_memory)
+            np.testing.assert_allclose(cvi[['sil', 'dbi', 'chi']], expected)
+
+        codes, _ = pd.factorize(L, sort=True)
+        sizes = np.bincount(codes)
+        centroids = np.stack([X[codes == c].mean(axis=0) for c in range(len(sizes))])
+        intra_dists = np.array([np.linalg.norm(X[codes == c] - centroids[c], axis=1).mean()
+                                for c in range(len(sizes))])
+        self.assertAlmostEqual(clustering._davies_bouldin(centroids, intra_dists), expected[1])
+        self.assertAlmostEqual(clustering._calinski_harabasz(centroids, sizes, X.mean(axis=0),
+                                                             np.sum((X - centroids[codes]) ** 2), len(X)), expected[2])
+
+        with self.assertRaises(ValueError):
+            clustering.validate_clustering(X, np.zeros(len(X)))
+
+    def test_silhouette_samples_memory(self):
+        codes, _ = pd.factorize(L, sort=True)
+        sizes = np.bincount(codes)
+        tracemalloc.start()
+        s = clustering._silhouette_samples(X, codes, sizes, np.arange(len(X)), working_memory=1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertAlmostEqual(s.mean(), silhouette_score(X, L))
+        self.assertLess(peak, 1.5 * 2 ** 20)    # one distance matrix of a chunk (1 MiB) and the sorted data
+
+    def test_validate_clustering_sample(self):
+        exact = silhouette_score(X, L)
+
+        # Sampling the whole dataset yields the exact score
+        cvi = clustering.validate_clustering(X, L, mode='sample', sample_size=len(X), random_state=0)
+        self.assertAlmostEqual(cvi.sil, exact)
+        self.assertAlmostEqual(cvi.sil_low, cvi.sil_high)
+
+        cvi = clustering.validate_clustering(X, L, mode='sample', sample_size=200, working_memory=1, random_state=0)
+        self.assertLess(cvi.sil_low, cvi.sil_high)
+        self.assertTrue(cvi.sil_low <= exact <= cvi.sil_high)
+        self.assertAlmostEqual(cvi.dbi, davies_bouldin_score(X, L))
+
+        with self.assertRaises(ValueError):
+            clustering.validate_clustering(X, L, mode='approximate')
+
+    def test_shap_tree(self):
+        data = pd.DataFrame(X[:300], columns=['a', 'b', 'c'])
+        model = KMeans(n_clusters=3, n_init=10, random_state=0).fit(data)
+        shap = clustering.explain_clustering_shap(model, data, sample_frac=1.0, surrogate='tree', max_depth=3)
+
+        # SHAP values of each instance add up to the surrogate's probability of its cluster minus the mean
+        # probability on the background data
+        tree = DecisionTreeClassifier(max_depth=3, random_state=0).fit(data, model.labels_)
+        background = clustering.shap_background(data, 3)
+        for c in range(3):
+            self.assertEqual(shap[c].shape, ((model.labels_ == c).sum(), 3))
+            proba = tree.predict_proba(data[model.labels_ == c])[:, c] - tree.predict_proba(background)[:, c].mean()
+            np.testing.assert_allclose(np.sort(shap[c].sum(axis=1)), np.sort(proba), atol=1e-6)
+
+        with self.assertRaises(ValueError):
+            clustering.explain_clustering_shap(model, data, surrogate='forest')
+
+    def test_class_shap_values(self):
+        values = np.arange(24).reshape(4, 3, 2)     # instances x features x classes
+        for i in range(2):
+            np.testing.assert_array_equal(clustering._class_shap_values([values[..., 0], values[..., 1]], i),
+                                          clustering._class_shap_values(values, i))
+
+    def test_shap_parallel(self):
+        data = pd.DataFrame(X[:60], columns=['a', 'b', 'c'])
+        model = KMeans(n_clusters=2, n_init=10, random_state=0).fit(data)
+        shap = clustering.explain_clustering_shap(model, data, min_sample_size=3, random_state=0)
+        shap_parallel = clustering.explain_clustering_shap(model, data, min_sample_size=3, n_jobs=2, random_state=0)
+        for c in range(2):
+            self.assertGreaterEqual(len(shap[c]), 3)
+            pd.testing.assert_frame_equal(shap[c], shap_parallel[c])
+
+    def test_tree_patterns(self):
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame({'x': rng.integers(0, 20, 300), 'y': np.round(rng.normal(size=300), 2),
+                             'color': rng.choice(['red', 'green', 'blue'], 300)})
+        labels = np.where(data.x < 7, 0, np.where(data.color == 'red', 1, 2))
+        labels[data.y > 1.5] = 3
+        patterns = clustering.patterns_from_cluster_tree(data, labels, max_depth=3, min_samples_leaf=5)
+
+        # Each pattern covers exactly the rows of a leaf of the tree
+        X = pd.get_dummies(data, columns=['color'], prefix_sep='#')
+        leaves = DecisionTreeClassifier(max_depth=3, min_samples_leaf=5, random_state=0).fit(X, labels).apply(X)
+        self.assertEqual(sorted(patterns), [0, 1, 2, 3])
+        for c, p in patterns.items():
+            idx = metrics.pattern_to_index(data, p)
+            self.assertTrue(idx.any())
+            np.testing.assert_array_equal(idx, leaves == leaves[np.argmax(idx)])
+
+    def test_path_to_pattern(self):
+        data = pd.DataFrame({'x': [0, 1, 2, 3, 4], 'y': [0.5, 1.5, 2.5, 3.5, 4.5], 'sex': ['M', 'F', 'F', 'M', 'F']})
+        indicators = {'sex#M': ('sex', 'M'), 'sex#F': ('sex', 'F')}
+
+        # x > 0.5 --> x >= 1, x <= 2.7 --> x <= 2, sex#M <= 0.5 --> sex != M --> sex = F
+        path = [('x', 2.7, False), ('x', 0.5, True), ('sex#M', 0.5, False)]
+        self.assertEqual(clustering._path_to_pattern(path, data, indicators),
+                         [('sex', '=', 'F'), ('x', '>=', 1), ('x', '<=', 2)])
+
+        # Bounds of a single observed value, tightest bound of repeated splits, indicator of a value
+        path = [('y', 3.0, False), ('y', 3.2, False), ('y', 2.0, True), ('x', 3.5, True), ('sex#M', 0.5, True)]
+        self.assertEqual(clustering._path_to_pattern(path, data, indicators),
+                         [('sex', '=', 'M'), ('y', '=', 2.5), ('x', '>=', 4)])
+
+    def test_lime_patterns(self):
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame({'x': np.round(rng.normal(size=60), 1), 'sex': rng.choice(['F', 'M'], 60)})
+        data.loc[:29, 'x'] += 5
+        dataX = pd.get_dummies(data, columns=['sex'], prefix_sep='#').astype(float)
+        model = KMeans(n_clusters=2, n_init=10, random_state=0).fit(dataX)
+
+        # Same weights in sequential and parallel mode (perturbations seeded per chunk, not per worker)
+        lime = clustering.explain_clustering_lime(model, dataX, min_sample_size=4, random_state=0, chunk_size=3)
+        lime_parallel = clustering.explain_clustering_lime(model, dataX, min_sample_size=4, n_jobs=2, random_state=0,
+                                                           chunk_size=3)
+        for c in range(2):
+            pd.testing.assert_series_equal(lime[c], lime_parallel[c])
+        lime_other = clustering.explain_clustering_lime(model, dataX, min_sample_size=4, random_state=1, chunk_size=3)
+        self.assertFalse(all(lime[c].equals(lime_other[c]) for c in range(2)))
+
+        patterns = clustering.patterns_from_cluster_lime(lime, data, dataX, model.labels_)
+        self.assertEqual(patterns, clustering.patterns_from_cluster_lime(lime_parallel, data, dataX, model.labels_))
+        self.assertEqual(patterns, clustering.patterns_from_cluster_lime(
+            clustering.explain_clustering_lime(model, dataX, min_sample_size=4, random_state=0, chunk_size=3), data,
+            dataX, model.labels_))
+
+        # Range of the instances of the cluster and negated binary indicator (sex#M = 0 --> sex = F)
+        data = pd.DataFrame({'x': [1, 2, 3, 4, 5, 6], 'sex': ['F', 'F', 'F', 'M', 'M', 'F']})
+        dataX = pd.get_dummies(data, columns=['sex'], prefix_sep='#').astype(float)
+        self.assertEqual(clustering._feature_patterns(['x', 'sex#M', 'sex#F'], data, data[:3], dataX[:3]),
+                         [('x', '<=', 3), ('sex', '=', 'F')])
+
+if __name__ == '__main__':
+    unittest.main()
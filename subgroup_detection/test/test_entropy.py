@@ -1,7 +1,11 @@
+import io
 import unittest
 import numpy as np
 import pandas as pd
 from subgroup_detection import entropy
+from subgroup_detection.binning import Binning, QuantileSketch
+from subgroup_detection.contingency import ClusterValueCounts
+from subgroup_detection.metrics import subgroups_to_cluster_patterns
 
 df = pd.DataFrame({
     'col1': ['a', 'b', 'b', 'c', 'b', 'c', 'a'],
@@ -53,6 +57,58 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(NEC.col2.iloc[0], - (0.25 * np.log(0.25) + 0.25 * np.log(0.25) + 0.5 * np.log(0.5)) / np.log(3))
         self.assertEqual(NEC.col2.iloc[1], - (0.5 * np.log(0.5) + 0.5 * np.log(0.5)) / np.log(2))
 
+    def test_cluster_value_counts(self):
+        counts = ClusterValueCounts.from_data(df)
+        self.assertEqual(counts.num_clusters, 2)
+        self.assertEqual(counts.n, 7)
+        self.assertListEqual(counts.sizes.tolist(), [4, 2])
+        self.assertListEqual(counts.values[0].tolist(), ['a', 'b', 'c'])
+        self.assertListEqual(counts.column_counts('col1').tolist(), [[0, 3, 1], [1, 0, 1]])
+        self.assertListEqual(counts.column_counts('col2').tolist(), [[0, 1, 1, 2, 0, 0], [0, 0, 0, 0, 1, 1]])
+        self.assertListEqual(counts.totals[counts.column_slice('col1')].tolist(), [2, 3, 2])
+
+        # Entropy from shared counts equals entropy from data
+        pd.testing.assert_frame_equal(entropy.normalized_entropy(counts), entropy.normalized_entropy(df))
+        pd.testing.assert_frame_equal(entropy.normalized_entropy_cluster(counts),
+                                      entropy.normalized_entropy_cluster(df))
+
+        # Missing values are counted as a value of their own (but never a modal value)
+        df_nan = df.assign(col3=['a', 'a', np.nan, np.nan, np.nan, 'b', 'c'])
+        counts = ClusterValueCounts.from_data(df_nan)
+        self.assertListEqual(counts.missing_counts().tolist(), [[0, 0, 3], [0, 0, 0]])
+        self.assertListEqual(counts.missing_totals().tolist(), [0, 0, 3])
+        H = - (0.25 * np.log(0.25) + 0.75 * np.log(0.75))
+        NEC = entropy.normalized_entropy_cluster(df_nan)
+        self.assertAlmostEqual(NEC.col3.iloc[0], H / np.log(2))
+        self.assertAlmostEqual(NEC.col3.iloc[1], 1.0)
+        self.assertAlmostEqual(entropy.normalized_entropy(df_nan).col3.iloc[0], H / np.log(4))
+        self.assertAlmostEqual(entropy.relative_entropy(df_nan).col3.iloc[0],
+                               0.25 * np.log(0.25 / (2 / 7)) + 0.75 * np.log(0.75 / (3 / 7)))
+        pd.testing.assert_frame_equal(entropy.normalized_entropy_cluster(counts), NEC)
+        self.assertEqual(entropy.normalized_entropy_groups(df_nan, 0.9).col3.iloc[0], 'a')
+
+    def test_cluster_value_counts_csv(self):
+        # Stream the dataset in chunks of 2 rows with separately given cluster labels
+        buffer = io.StringIO(df.drop(columns='cluster').to_csv(index=False))
+        counts = ClusterValueCounts.from_csv(buffer, labels=df['cluster'].values, chunksize=2)
+        self.assertEqual(counts.n, 7)
+        self.assertListEqual(counts.sizes.tolist(), [4, 2])
+        self.assertListEqual(counts.column_counts('col1').tolist(), [[0, 3, 1], [1, 0, 1]])
+
+        pd.testing.assert_frame_equal(entropy.normalized_entropy_cluster(counts),
+                                      entropy.normalized_entropy_cluster(df))
+        pd.testing.assert_frame_equal(entropy.relative_entropy(counts), entropy.relative_entropy(df))
+        pd.testing.assert_frame_equal(entropy.normalized_entropy_groups(counts, 0.65),
+                                      entropy.normalized_entropy_groups(df, 0.65))
+
+        # Column parsed as numbers in the first chunks and as strings in the last one
+        mixed = pd.DataFrame({'col': ['1', '2', '1', '2', 'x', '1'], 'cluster': [0, 0, 1, 1, 1, 0]})
+        for chunksize in (2, 4, 6):
+            counts = ClusterValueCounts.from_csv(io.StringIO(mixed.drop(columns='cluster').to_csv(index=False)),
+                                                 labels=mixed['cluster'].values, chunksize=chunksize)
+            self.assertListEqual(counts.values[0].tolist(), ['1', '2', 'x'])
+            self.assertListEqual(counts.column_counts('col').tolist(), [[2, 1, 0], [1, 1, 1]])
+
     def test_cluster_groups_normalized(self):
         NE = entropy.normalized_entropy(df)
 
@@ -94,5 +150,42 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(G.col1.iloc[1], 'a')
         self.assertTrue(np.isnan(G.col2.iloc[1]))
 
+    def test_cluster_groups_sweep(self):
+        NE = entropy.normalized_entropy(df)
+        thresholds = [0, 0.5, 0.6]
+        sweep = entropy.cluster_groups_sweep(df, NE, thresholds)
+        self.assertListEqual(list(sweep.keys()), thresholds)
+        for t in thresholds:
+            pd.testing.assert_frame_equal(sweep[t], entropy.cluster_groups(df, NE, t))
+
+        # Every distinct breakpoint (each entropy value and infinity)
+        sweep = entropy.normalized_entropy_groups_sweep(df)
+        self.assertEqual(len(sweep), len(np.unique(entropy.normalized_entropy_cluster(df))) + 1)
+        for t, G in sweep.items():
+            pd.testing.assert_frame_equal(G, entropy.normalized_entropy_groups(df, t))
+
+    def test_binning(self):
+        # Exact quantiles as long as the sketch capacity is not exceeded
+        sketch = QuantileSketch(k=100).update(np.arange(100))
+        self.assertListEqual(sketch.quantiles([0.25, 0.5]).tolist(), [25, 50])
+
+        data = pd.DataFrame({
+            'age': [20, 25, 31, 38, 44, 52, 58, 63, 70, 77],
+            'sex': ['m', 'f', 'm', 'f', 'm', 'f', 'm', 'f', 'm', 'f'],
+            'cluster': [0, 0, 0, 0, 0, 1, 1, 1, 1, 1]
+        })
+        binning = Binning(n_bins=2, max_values=5).fit(data.drop(columns='cluster'))
+        self.assertListEqual(binning.columns, ['age'])
+
+        binned = binning.transform(data)
+        self.assertListEqual(binned.age.cat.categories.tolist(),
+                             [pd.Interval(20, 44, closed='both'), pd.Interval(52, 77, closed='both')])
+
+        G = entropy.normalized_entropy_groups(binned, threshold=0.5)
+        self.assertListEqual(G.columns.tolist(), ['age'])
+        patterns = subgroups_to_cluster_patterns(G)
+        self.assertListEqual(patterns[0], [('age', '>=', 20), ('age', '<=', 44)])
+        self.assertListEqual(patterns[1], [('age', '>=', 52), ('age', '<=', 77)])
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,13 @@
+import time
 import unittest
+import numpy as np
 import pandas as pd
-from subgroup_detection import fairness
+from aif360.datasets import BinaryLabelDataset
+from aif360.metrics import ClassificationMetric
+from aif360.sklearn import metrics as mtr
+from sklearn.cluster import KMeans
+from subgroup_detection import fairness, metrics
+from subgroup_detection.lattice import lattice_subgroups
 
 X = pd.DataFrame({
     'out':   [0,0,0,0,1,1,1,1],
@@ -30,10 +37,16 @@ G = pd.DataFrame({
 })
 
 
+class SlowKMeans(KMeans):
+    def fit(self, X, y=None, sample_weight=None):
+        time.sleep(10)
+        return super().fit(X, y=y, sample_weight=sample_weight)
+
+
 class MyTestCase(unittest.TestCase):
     def test_cluster_fairness(self):
         # TODO adapt FairnessResult
-        general, subgroup, priv_groups = fairness.cluster_fairness(X, L, G, pos_label=0)
+        general, subgroup, priv_groups, group_sizes = fairness.cluster_fairness(X, L, G, pos_label=0)
 
         print(subgroup.c_eq_opp)
         print(subgroup.g_eq_opp)
@@ -91,6 +104,155 @@ class MyTestCase(unittest.TestCase):
         self.assertAlmostEqual(subgroup.g_avg_odds.iloc[2], ((1 - 1 / 3) + (3 / 3 - 0 / 2)) / 2) # FPR=1 (0 neg ex)
         self.assertAlmostEqual(subgroup.g_acc.iloc[2], 3 / 3)
 
+    def test_cluster_fairness_bootstrap(self):
+        _, subgroup, _, _, ci = fairness.cluster_fairness(X, L, G, pos_label=0, n_bootstrap=200, random_state=0)
+
+        self.assertEqual(ci.shape, (3, 16))     # num_cluster x (low, high) per metric
+        self.assertTrue((ci.filter(like='_low').values <= ci.filter(like='_high').values).all())
+        # Accuracy of a cluster that is always classified correctly does not vary
+        self.assertAlmostEqual(ci.c_acc_low.iloc[0], subgroup.c_acc.iloc[0])
+        self.assertAlmostEqual(ci.c_acc_high.iloc[0], subgroup.c_acc.iloc[0])
+
+    def test_lattice_subgroups(self):
+        top = lattice_subgroups(X, pos_label=1, top_k=2, min_support=0.25)
+
+        self.assertEqual(top.pattern.tolist(), [[('A', '=', 'h')], [('A', '=', 'w')]])
+        self.assertEqual(top['size'].tolist(), [3, 2])
+        self.assertAlmostEqual(top.stat_par.iloc[0], 1 / 5 - 3 / 3)
+        self.assertAlmostEqual(top.stat_par.iloc[1], 4 / 6 - 0 / 2)
+
+        # Batches of a single candidate yield the same subgroups
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame({'A': rng.choice(['a', 'b', 'c'], 200), 'B': rng.choice(['x', 'y'], 200),
+                             'C': rng.choice(['u', 'v'], 200), 'class': rng.integers(0, 2, 200),
+                             'out': rng.integers(0, 2, 200)})
+        pd.testing.assert_frame_equal(lattice_subgroups(data, top_k=5, metric='avg_odds', batch_size=1),
+                                      lattice_subgroups(data, top_k=5, metric='avg_odds'))
+
+        # Same fairness as a cluster vs. the rest of the dataset
+        top = lattice_subgroups(X, pos_label=1, top_k=3, min_support=0.25, metric='avg_odds')
+        labels = np.array([0, 0, 1, 1, 2, 2, 2, 1])    # clusters A=w, A=b, A=h
+        _, subgroup, _, _ = fairness.cluster_fairness(X, labels, G, pos_label=1)
+        for pattern, avg_odds in zip(top.pattern, top.avg_odds):
+            c = ['w', 'b', 'h'].index(pattern[0][2])
+            self.assertAlmostEqual(avg_odds, subgroup.c_avg_odds.iloc[c])
+
+    def test_confusion_counts(self):
+        counts = fairness.confusion_counts(np.array(L), X['class'].values, X['out'].values, 3)
+
+        self.assertEqual(counts.shape, (3, 2, 2))       # num_cluster x class x out
+        np.testing.assert_array_equal(counts[0], [[2, 0], [0, 0]])
+        np.testing.assert_array_equal(counts[1], [[0, 0], [2, 1]])
+        np.testing.assert_array_equal(counts[2], [[0, 1], [0, 2]])
+
+        # Outliers are not counted
+        counts = fairness.confusion_counts(np.array([-1] + L[1:]), X['class'].values, X['out'].values, 3)
+        np.testing.assert_array_equal(counts[0], [[1, 0], [0, 0]])
+
+    def test_subgroup_fairness_metrics(self):
+        rng = np.random.default_rng(0)
+        y_true, y_pred, labels = rng.integers(0, 2, 60), rng.integers(0, 2, 60), rng.integers(0, 4, 60)
+        labels[(labels == 2) & (y_true == 0)] = 1     # cluster 2 without negatives
+        labels[(labels == 3) & (y_true == 1)] = 1     # cluster 3 without positives
+        k = 5                                           # cluster 4 is empty
+
+        counts = fairness.confusion_counts(labels, y_true, y_pred, k)
+        for pos_label in (0, 1):
+            res = fairness.subgroup_fairness_metrics(counts, counts.sum(axis=0) - counts, pos_label)
+            C = fairness.confusion_matrices(counts, counts.sum(axis=0) - counts, pos_label)
+            for c in range(k):
+                group = labels == c
+                data = pd.DataFrame({'g': group, 'class': y_true, 'out': y_pred})
+                self.assertEqual(tuple(m[c] for m in C), metrics.conf_matrix(data, [('g', '=', True)], pos_label))
+
+                # Same zero-division conventions as the aif360 metrics used for single groups
+                y = pd.Series(y_true, index=pd.Index(group, name='g'))
+                expected = [f(y, y_pred, prot_attr='g', priv_group=True, pos_label=pos_label)
+                            for f in (mtr.statistical_parity_difference, mtr.equal_opportunity_difference,
+                                      mtr.average_odds_difference)]
+                np.testing.assert_allclose([m[c] for m in res[:3]], expected)
+                if group.any():
+                    self.assertAlmostEqual(res[3][c], np.mean(y_true[group] == y_pred[group]))
+                else:
+                    self.assertTrue(np.isnan(res[3][c]))
+
+                # Same values as the aif360 classification metric where it is defined (non-empty rates)
+                data = BinaryLabelDataset(df=pd.DataFrame({'g': group.astype(float), 'class': y_true.astype(float)}),
+                                          label_names=['class'], protected_attribute_names=['g'],
+                                          favorable_label=pos_label, unfavorable_label=1 - pos_label)
+                pred = data.copy()
+                pred.labels = y_pred.astype(float).reshape(-1, 1)
+                metric = ClassificationMetric(data, pred, unprivileged_groups=[{'g': 0}],
+                                              privileged_groups=[{'g': 1}])
+                for value, reference in zip(res, (metric.statistical_parity_difference(),
+                                                  metric.equal_opportunity_difference(),
+                                                  metric.average_odds_difference())):
+                    if not np.isnan(reference):
+                        self.assertAlmostEqual(value[c], reference)
+                if group.any():
+                    self.assertAlmostEqual(res[3][c], metric.accuracy(privileged=True))
+
+    def test_benchmark_clustering(self):
+        models = [KMeans(n_clusters=k, n_init=10, random_state=0) for k in (2, 3, 4)]
+        serial = fairness.iter_benchmark_clustering(models, X, pos_label=0)
+        scores = {m.n_clusters: score for m, _, score in serial}
+        self.assertEqual(sorted(scores), [2, 3, 4])
+
+        # Parallel results (in the order of completion) of the models of a generator
+        parallel = fairness.iter_benchmark_clustering((m for m in models), X, pos_label=0, n_jobs=2)
+        parallel_scores = {m.n_clusters: score for m, _, score in parallel}
+        self.assertEqual(sorted(parallel_scores), [2, 3, 4])
+        for k in scores:
+            self.assertAlmostEqual(parallel_scores[k], scores[k])
+
+        # Fitting models is stopped when the time budget is exceeded (also in serial mode)
+        for n_jobs in (None, 2):
+            start = time.monotonic()
+            results = list(fairness.iter_benchmark_clustering(models[:1] + [SlowKMeans(n_clusters=2, n_init=10)],
+                                                              X, pos_label=0, n_jobs=n_jobs, time_budget=3))
+            self.assertLess(time.monotonic() - start, 8)
+            self.assertEqual([m.n_clusters for m, _, _ in results], [2])
+        with self.assertRaises(TimeoutError):
+            fairness.benchmark_clustering([SlowKMeans(n_clusters=2, n_init=10)], X, pos_label=0, time_budget=1)
+
+    def test_duplicate_groups(self):
+        groups = pd.DataFrame({'A': ['w', 'b', 'w']})
+        labels = [0, 0, 1, 1, 1, 2, 2, 2]
+        _, subgroup, _, group_sizes = fairness.cluster_fairness(X, labels, groups, pos_label=0)
+
+        # Duplicate group (cluster 2) reuses the result of the first group A=w (cluster 0)
+        self.assertEqual(group_sizes, [2, 3, 2])
+        pd.testing.assert_series_equal(subgroup.iloc[2].filter(regex='^g_'), subgroup.iloc[0].filter(regex='^g_'),
+                                       check_names=False)
+
+    def test_fairness_result_bytes(self):
+        res = fairness.test_model_fairness(X, cluster_labels=np.array(L), pos_label=0)
+        parsed = fairness.FairnessResult.from_bytes(res.to_bytes())
+
+        self.assertEqual(parsed.clustering.dtype, np.uint8)     # narrowest int type
+        np.testing.assert_array_equal(parsed.clustering, L)
+        pd.testing.assert_frame_equal(parsed.raw, res.raw)
+        pd.testing.assert_frame_equal(parsed.fair, res.fair)
+        pd.testing.assert_series_equal(parsed.c_acc, res.c_acc)
+        pd.testing.assert_series_equal(parsed.cvi, res.cvi)
+        pd.testing.assert_frame_equal(parsed.subgroups, res.subgroups)
+        self.assertEqual(parsed.group_sizes, res.group_sizes)
+        self.assertEqual(parsed.cvi_mode, 'exact')
+        self.assertEqual(parsed.to_json(), res.to_json())   # JSON for the frontend from the stored result
+
+        # Intervals of binned features (and missing values) are restored as intervals
+        rng = np.random.default_rng(0)
+        age = rng.integers(18, 80, 300)
+        data = pd.DataFrame({'age': age, 'A': rng.choice(['w', 'b', 'h'], 300), 'class': (age > 50).astype(int),
+                             'out': rng.integers(0, 2, 300)})
+        res = fairness.test_model_fairness(data, cluster_labels=np.digitize(age, [35, 60]), n_bins=3)
+        parsed = fairness.FairnessResult.from_bytes(res.to_bytes())
+        self.assertIsInstance(res.subgroups.age.dtype, pd.IntervalDtype)
+        self.assertTrue(res.subgroups.age.isna().any())
+        pd.testing.assert_frame_equal(parsed.subgroups, res.subgroups)
+        self.assertIsInstance(parsed.subgroups.age.dropna().iloc[0], pd.Interval)
+        self.assertEqual(parsed.to_json(), res.to_json())
+
 
 if __name__ == '__main__':
     unittest.main()
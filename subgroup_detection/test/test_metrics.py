@@ -0,0 +1,94 @@
+import unittest
+import numpy as np
+import pandas as pd
+from subgroup_detection import metrics
+
+df = pd.DataFrame({
+    'A': ['w', 'w', 'b', 'b', 'h', 'h', 'h', 'b'],
+    'B': [1, 2, 3, 4, 5, 6, 7, 8],
+    'out':   [0, 0, 0, 0, 1, 1, 1, 1],
+    'class': [0, 0, 1, 1, 1, 1, 1, 0],
+})
+
+patterns = {
+    0: [('A', '=', 'w')],
+    1: [('A', '=', 'b'), ('B', '<=', 4)],
+    2: [('B', '>=', 4), ('A', '!=', 'w')],
+}
+
+
+class MyTestCase(unittest.TestCase):
+    def test_pattern_evaluator(self):
+        ev = metrics.PatternEvaluator(df, maxsize=2)
+        idx1, idx2 = ev.index(patterns[1]), ev.index(patterns[2])
+        np.testing.assert_array_equal(idx1, [False, False, True, True, False, False, False, False])
+        np.testing.assert_array_equal(idx2, [False, False, False, True, True, True, True, True])
+
+        # Cached masks are shared and evicted in LRU order
+        self.assertIs(ev.index(list(reversed(patterns[1]))), idx1)
+        ev.index(patterns[0])
+        self.assertIs(ev.index(patterns[1]), idx1)
+        self.assertIsNot(ev.index(patterns[2]), idx2)
+        np.testing.assert_array_equal(ev.index(patterns[2]), idx2)
+
+        # The filter of a pattern is a series on the index of the dataset
+        idx = metrics.pattern_to_index(ev, patterns[1])
+        self.assertIsInstance(idx, pd.Series)
+        pd.testing.assert_index_equal(idx.index, df.index)
+        np.testing.assert_array_equal(idx, idx1)
+
+        with self.assertRaises(metrics.UndefinedOperatorError):
+            ev.index([('B', '<', 4)])
+
+    def test_range_index(self):
+        data = pd.DataFrame({'x': np.arange(100) % 37, 'y': np.arange(100) / 10, 'z': ['a', 'b'] * 50})
+        data.loc[::9, 'y'] = np.nan
+        ev = metrics.PatternEvaluator(data, range_index=True)
+        for p in ([('x', '>=', 3), ('x', '<=', 5), ('y', '<=', 5)], [('y', '>=', 2.5), ('z', '=', 'a')],
+                  [('x', '=', 36), ('z', '!=', 'a')], [('y', '>=', 20)]):
+            np.testing.assert_array_equal(ev.index(p), metrics.pattern_to_index(data, p))
+
+        # '!=' on the most selective range column is checked on the rows of the range
+        data = pd.DataFrame({'age': np.random.RandomState(0).randint(0, 100, 100000)})
+        p = [('age', '>=', 10), ('age', '<=', 20), ('age', '!=', 15)]
+        idx = metrics.PatternEvaluator(data, range_index=True).index(p)
+        np.testing.assert_array_equal(idx, metrics.PatternEvaluator(data, range_index=False).index(p))
+        self.assertFalse(idx[data['age'] == 15].any())
+
+    def test_pattern_metrics(self):
+        ev = metrics.PatternEvaluator(df)
+        for data in (df, ev):
+            self.assertEqual(metrics.cluster_pattern_support(patterns, data), {0: 2 / 8, 1: 2 / 8, 2: 5 / 8})
+            self.assertEqual(metrics.cluster_coverage(patterns, data), 1.0)
+            self.assertEqual(metrics.cluster_containment_score(patterns, data), {0: 0, 1: 1 / 2, 2: 1 / 5})
+            with self.assertRaises(ValueError):
+                metrics.cluster_containment_score({0: patterns[0]}, data)
+
+    def test_pattern_intersections(self):
+        membership = metrics.pattern_membership(patterns, df)
+        self.assertEqual(membership.shape, (3, 8))      # 8 instances packed into one (padded) 64-bit word
+
+        inter = metrics.pattern_intersections(membership, chunk_size=1)
+        np.testing.assert_array_equal(inter, [[2, 0, 0], [0, 2, 1], [0, 1, 5]])
+        self.assertEqual(metrics.cluster_fidelity(patterns, df, np.array([0, 0, 1, 1, 2, 2, 2, 2])),
+                         {0: 1.0, 1: 1.0, 2: 4 / 5})
+        self.assertEqual(metrics.cluster_fidelity(patterns, df, [0, 0, 1, 1, 2, 2, 2, 2]), {0: 1.0, 1: 1.0, 2: 4 / 5})
+
+    def test_conf_matrices(self):
+        membership = metrics.pattern_membership(patterns, df)
+        for pos_label in (0, 1):
+            C = metrics.conf_matrices(membership, df, pos_label=pos_label)
+            for c, c2 in zip(C, metrics.conf_matrices(membership, df, pos_label=pos_label, chunk_size=2)):
+                np.testing.assert_array_equal(c, c2)
+            for i, p in enumerate(patterns.values()):
+                self.assertEqual(tuple(c[i] for c in C), metrics.conf_matrix(df, p, pos_label=pos_label))
+
+            res = metrics.compute_metrics(patterns, df, pos_label=pos_label)
+            self.assertEqual(res.shape, (3, 3))
+            self.assertAlmostEqual(res['Stat. parity diff.'].iloc[1],
+                                   metrics.statistical_parity_difference(metrics.conf_matrix(df, patterns[1],
+                                                                                             pos_label=pos_label)))
+
+
+if __name__ == '__main__':
+    unittest.main()
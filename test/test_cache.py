@@ -0,0 +1,60 @@
+import unittest
+
+import pandas as pd
+
+from app.cache import DataCache
+
+
+class DataCacheTestCase(unittest.TestCase):
+    def test_data_cache(self):
+        df = pd.DataFrame({'a': range(100)})
+        nbytes = int(df.memory_usage(deep=True).sum())
+        data_cache = DataCache(max_bytes=2 * nbytes)
+
+        # Loaded once per version
+        self.assertIs(data_cache.get('x', 1, lambda: df), df)
+        self.assertIs(data_cache.get('x', 1, lambda: df.copy()), df)
+        self.assertIsNot(data_cache.get('x', 2, lambda: df.copy()), df)
+        self.assertEqual(data_cache.stats(), {'hits': 1, 'misses': 2, 'entries': 1, 'bytes': nbytes})
+
+        # Least recently used entry evicted by memory footprint
+        data_cache.get('y', 1, lambda: df)
+        data_cache.get('x', 2, lambda: df)
+        data_cache.get('z', 1, lambda: df)
+        self.assertEqual(data_cache.stats()['entries'], 2)
+        self.assertIsNot(data_cache.get('y', 1, lambda: df.copy()), df)
+
+        # Explicit invalidation
+        data_cache.invalidate(lambda key: key == 'z')
+        self.assertEqual(data_cache.stats()['entries'], 1)
+
+    def test_derived(self):
+        df = pd.DataFrame({'a': range(100)})
+        nbytes = int(df.memory_usage(deep=True).sum())
+        data_cache = DataCache(max_bytes=5 * nbytes // 2)
+
+        class Index:
+            def __init__(self, data):
+                self.data = data
+                self.nbytes = 0
+
+        # Not built for data that is not cached (or of another version)
+        self.assertIsNone(data_cache.derived('x', 1, 'index', Index))
+        data_cache.get('x', 1, lambda: df)
+        self.assertIsNone(data_cache.derived('x', 2, 'index', Index))
+
+        # Built once with the data and counted in its footprint
+        index = data_cache.derived('x', 1, 'index', Index)
+        self.assertIs(index.data, df)
+        self.assertIs(data_cache.derived('x', 1, 'index', Index), index)
+        index.nbytes = nbytes
+        data_cache.update('x')
+        self.assertEqual(data_cache.stats()['bytes'], 2 * nbytes)
+
+        # Evicted when it grows beyond the capacity
+        data_cache.get('y', 1, lambda: df)
+        self.assertEqual(data_cache.stats(), {'hits': 0, 'misses': 2, 'entries': 1, 'bytes': nbytes})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import pandas as pd
+from flask import Flask
+
+from app.blueprints.util import analysis_columns, load_data, save_data
+
+
+class DataTestCase(unittest.TestCase):
+    def test_load_columns(self):
+        df = pd.DataFrame({'a': range(10), 'class': [0, 1] * 5, 'b': list('abcdefghij'), 'out': [1, 0] * 5})
+        app = Flask(__name__)
+        with tempfile.TemporaryDirectory() as folder, app.app_context():
+            app.config['UPLOAD_FOLDER'] = folder
+            os.makedirs(os.path.join(folder, 'user'))
+            dataset = SimpleNamespace(owner='user', id='data', label_column='class', prediction_column='out',
+                                      columns=None)
+            save_data(dataset, df)
+
+            # Only the selected columns are read (and cached separately from the entire dataset)
+            pd.testing.assert_frame_equal(load_data('user', 'data', columns=['b', 'a']), df[['b', 'a']])
+            pd.testing.assert_frame_equal(load_data('user', 'data'), df)
+
+            # Features of the analysis followed by the label and prediction column
+            self.assertEqual(analysis_columns(dataset), ['a', 'b', 'class', 'out'])
+
+
+if __name__ == '__main__':
+    unittest.main()
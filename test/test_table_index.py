@@ -0,0 +1,33 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from app.table_index import TableIndex
+
+
+class TableIndexTestCase(unittest.TestCase):
+    def test_query(self):
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame({'a': rng.choice(['alpha', 'beta', 'gamma', 'alphabet', None], 500),
+                             'b': rng.integers(0, 1000, 500),
+                             'c': rng.choice([1.5, 2.5, np.nan], 500)})
+        index = TableIndex(data)
+        for filters in [None, {'a': 'alpha'}, {'a': 'ph', 'b': '1'}, {'a': 'bet', 'c': '2.5'}, {'a': 'xyz'}]:
+            expected = data
+            for col, pattern in (filters or {}).items():
+                expected = expected[expected[col].astype(str).str.contains(pattern, regex=False)]
+            for sort in ['b', 'c']:
+                for ascending in [True, False]:
+                    for offset in [0, 7, 490]:
+                        total, rows = index.query(filters, sort=sort, ascending=ascending, offset=offset, limit=10)
+                        self.assertEqual(total, len(expected))
+                        page = expected[sort].sort_values(ascending=ascending, na_position='last')
+                        page = page.iloc[offset:offset + 10]
+                        np.testing.assert_array_equal(data[sort].iloc[rows].to_numpy(), page.to_numpy())
+            total, rows = index.query(filters, offset=3, limit=10)
+            np.testing.assert_array_equal(rows, np.flatnonzero(data.index.isin(expected.index))[3:13])
+
+
+if __name__ == '__main__':
+    unittest.main()